@@ -3,10 +3,34 @@ import random
 import sys
 import math
 import os
+import pickle
+import sqlite3
+import argparse
+import asyncio
+import cProfile
+import gc
+import json
+import marshal
+import signal
+import socket
+import threading
+import time
+from array import array
+from collections import deque, OrderedDict
+from itertools import repeat
 from PIL import Image, ImageSequence
 
+import runstore
+
 # Use the current working directory for asset loading
 ASSET_DIR = os.getcwd()
+QUICKSAVE_PATH = os.path.join(ASSET_DIR, "quicksave.dat")
+PROFILE_DIR = os.path.join(ASSET_DIR, "profiles")
+RUNS_DB_PATH = os.path.join(ASSET_DIR, "runs.db")
+
+# Cosmetic randomness (sparkles, trails, explosion debris, shake) uses its own
+# generator so the gameplay RNG stream only depends on gameplay decisions
+fx_random = random.Random()
 
 pygame.init()
 
@@ -65,6 +89,230 @@ clock = pygame.time.Clock()
 # Create virtual surface for rendering at base resolution
 virtual_surface = pygame.Surface((BASE_WIDTH, BASE_HEIGHT))
 
+# Quality levels, cheapest first. The governor moves between these to hold FPS.
+# render_scale only applies to smooth scaling: the virtual surface is filtered down
+# to that fraction of the window and then stretched up with a plain scale.
+QUALITY_LEVELS = [
+    {'name': 'minimal', 'laser_sparkles': 0, 'laser_glow_passes': 0, 'bullet_trail': 0.0,
+     'explosion_particles': 6, 'powerup_glow': False, 'powerup_border': False,
+     'smooth_scale': False, 'render_scale': 1.0},
+    {'name': 'low', 'laser_sparkles': 1, 'laser_glow_passes': 1, 'bullet_trail': 0.1,
+     'explosion_particles': 10, 'powerup_glow': False, 'powerup_border': False,
+     'smooth_scale': True, 'render_scale': 0.5},
+    {'name': 'medium', 'laser_sparkles': 2, 'laser_glow_passes': 3, 'bullet_trail': 0.2,
+     'explosion_particles': 14, 'powerup_glow': True, 'powerup_border': False,
+     'smooth_scale': True, 'render_scale': 0.75},
+    {'name': 'high', 'laser_sparkles': 3, 'laser_glow_passes': 5, 'bullet_trail': 0.3,
+     'explosion_particles': 20, 'powerup_glow': True, 'powerup_border': True,
+     'smooth_scale': True, 'render_scale': 1.0},
+]
+
+class QualityGovernor:
+    """Steps the quality level down when recent frames run over budget and back up
+    once there has been enough headroom for a while"""
+    def __init__(self, target_fps=FPS, window=30):
+        self.budget_ms = 1000 / target_fps
+        self.level = len(QUALITY_LEVELS) - 1
+        self.samples = deque(maxlen=window)
+        # Hysteresis: step down above 90% of the budget, only step up below 60%
+        self.downgrade_ratio = 0.9
+        self.upgrade_ratio = 0.6
+        self.upgrade_delay = 180  # frames of headroom needed before stepping up
+        self.max_upgrade_delay = 60 * FPS
+        self.headroom_frames = 0
+        self.frames_since_change = 0
+        self.last_change_was_upgrade = False
+        self.max_sample_ms = 250  # longer frames are stalls (menus, checkpoint pause)
+
+    @property
+    def settings(self):
+        return QUALITY_LEVELS[self.level]
+
+    def update(self, frame_ms):
+        if frame_ms > self.max_sample_ms:
+            return
+        self.samples.append(frame_ms)
+        self.frames_since_change += 1
+        if len(self.samples) < self.samples.maxlen:
+            return
+
+        average = sum(self.samples) / len(self.samples)
+        if average > self.budget_ms * self.downgrade_ratio:
+            if self.level > 0:
+                # Stepping straight back down after an upgrade means that level does
+                # not fit, so wait longer before trying it again
+                if self.last_change_was_upgrade and self.frames_since_change < self.upgrade_delay:
+                    self.upgrade_delay = min(self.upgrade_delay * 2, self.max_upgrade_delay)
+                self.set_level(self.level - 1)
+        elif average < self.budget_ms * self.upgrade_ratio:
+            self.headroom_frames += 1
+            if self.headroom_frames >= self.upgrade_delay and self.level < len(QUALITY_LEVELS) - 1:
+                self.set_level(self.level + 1)
+        else:
+            self.headroom_frames = 0
+
+    def set_level(self, level):
+        self.last_change_was_upgrade = level > self.level
+        self.level = level
+        self.samples.clear()
+        self.headroom_frames = 0
+        self.frames_since_change = 0
+
+quality_governor = QualityGovernor()
+
+class FrameScheduler:
+    """Runs deferred work in the time left over at the end of each frame.
+
+    Automatic garbage collection is off during gameplay. The scheduler runs a
+    generation itself once it is due and its measured cost fits the frame's
+    slack, so collections stop landing in the middle of a frame. Periodic
+    and one-off tasks (cache trimming, log flushing, asset prefetch) wait for
+    slack the same way. A young collection put off for too long runs anyway,
+    which keeps garbage bounded on machines that never have slack.
+    """
+    def __init__(self, target_fps=FPS, margin_ms=1.0, max_gc_delay=10):
+        self.budget_ms = 1000 / target_fps
+        self.margin_ms = margin_ms  # kept free for clock.tick and event handling
+        self.max_gc_delay = max_gc_delay  # young collection is forced past this many thresholds
+        self.frame_start = None
+        self.gameplay = False
+        self.tasks = deque()  # one-off (name, func, args)
+        self.periodic = []    # [name, interval ms, func, next due]
+        self.cost_ms = {}     # task name -> recent worst cost
+        self.running_task = None
+        self.gc_started = None
+        self.slack_ms = 0.0
+        self.slack_collections = 0
+        self.slack_gc_ms = 0.0
+        self.max_gc_ms = 0.0
+        self.forced_collections = 0
+        self.frame_collections = 0
+
+    def install(self):
+        """Start timing collections. Only the game loop does this, so importing main stays side-effect free."""
+        if self._on_gc not in gc.callbacks:
+            gc.callbacks.append(self._on_gc)
+
+    def freeze(self):
+        """Move everything loaded so far out of the collector's reach"""
+        gc.collect()
+        gc.freeze()
+
+    def enter_gameplay(self):
+        self.gameplay = True
+        self.frame_start = None
+        gc.disable()
+
+    def leave_gameplay(self):
+        self.gameplay = False
+        self.frame_start = None
+        gc.enable()
+
+    def defer(self, name, func, *args):
+        self.tasks.append((name, func, args))
+
+    def every(self, name, seconds, func):
+        self.periodic.append([name, seconds * 1000, func, 0])
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """Spend whatever is left of this frame's budget on due work"""
+        if self.frame_start is None:
+            return
+        elapsed_ms = (time.perf_counter() - self.frame_start) * 1000
+        self.frame_start = None
+        self.run_deferred(self.budget_ms - self.margin_ms - elapsed_ms)
+
+    def run_deferred(self, slack_ms):
+        self.slack_ms = slack_ms
+        deadline = time.perf_counter() + slack_ms / 1000
+        if self.gameplay:
+            self._collect(deadline)
+        now_ms = pygame.time.get_ticks()
+        for task in self.periodic:
+            name, interval_ms, func, due_ms = task
+            if now_ms >= due_ms and self._fits(name, deadline):
+                task[3] = now_ms + interval_ms
+                self._run(name, func)
+        # One-off tasks keep their order, so stop at the first that doesn't fit
+        while self.tasks and self._fits(self.tasks[0][0], deadline):
+            name, func, args = self.tasks.popleft()
+            self._run(name, func, *args)
+
+    def run_idle(self):
+        """Menus have time to spare: run everything that is due"""
+        self.run_deferred(self.budget_ms)
+        while self.tasks:
+            name, func, args = self.tasks.popleft()
+            self._run(name, func, *args)
+
+    def _collect(self, deadline):
+        counts = gc.get_count()
+        thresholds = gc.get_threshold()
+        # Collecting a generation also collects the younger ones, so try the oldest due first
+        for generation in (2, 1, 0):
+            if counts[generation] >= thresholds[generation] and self._fits(f"gc{generation}", deadline):
+                self._run(f"gc{generation}", gc.collect, generation)
+                return
+        if counts[0] >= thresholds[0] * self.max_gc_delay:
+            # Past its deadline, so this one is a pause rather than slack
+            self.forced_collections += 1
+            self._run("forced gc0", gc.collect, 0)
+
+    def _fits(self, name, deadline):
+        return time.perf_counter() + self.cost_ms.get(name, 0.5) / 1000 <= deadline
+
+    def _run(self, name, func, *args):
+        self.running_task = name
+        start = time.perf_counter()
+        try:
+            func(*args)
+        finally:
+            self.running_task = None
+        cost_ms = (time.perf_counter() - start) * 1000
+        # Slow decay, so one lucky run doesn't make a task look cheap
+        self.cost_ms[name] = max(cost_ms, self.cost_ms.get(name, 0) * 0.95)
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self.gc_started = time.perf_counter()
+            return
+        if self.gc_started is None:
+            return
+        pause_ms = (time.perf_counter() - self.gc_started) * 1000
+        self.gc_started = None
+        if self.running_task is None:
+            if self.gameplay:
+                self.frame_collections += 1
+        elif self.running_task.startswith('gc'):
+            self.slack_collections += 1
+            self.slack_gc_ms += pause_ms
+            self.max_gc_ms = max(self.max_gc_ms, pause_ms)
+        # Forced collections are counted where they are run
+
+    def debug_lines(self):
+        return [
+            f"GC: {self.slack_collections} in slack, {self.slack_gc_ms:.1f} ms kept out of frames "
+            f"(max {self.max_gc_ms:.2f} ms)",
+            f"Slack: {self.slack_ms:.1f} ms, {len(self.tasks)} deferred, "
+            f"{self.forced_collections} forced, {self.frame_collections} mid-frame GCs",
+        ]
+
+frame_scheduler = FrameScheduler()
+
+# Game loop messages wait in a buffer and are written out in the frame's slack
+_log_lines = []
+
+def log(message):
+    _log_lines.append(message)
+
+def flush_log():
+    if _log_lines:
+        print('\n'.join(_log_lines), flush=True)
+        _log_lines.clear()
+
 def scale_coords_to_virtual(screen_x, screen_y):
     """Convert screen coordinates to virtual coordinates
     Use this function when handling mouse input to convert screen coordinates
@@ -81,10 +329,53 @@ def scale_coords_to_screen(virtual_x, virtual_y):
     screen_y = int(virtual_y * SCALE + LETTERBOX_Y)
     return screen_x, screen_y
 
-def render_to_screen():
-    """Scale the virtual surface to screen with responsive scaling"""
+# Window resizes are applied once the window has stopped changing size for this long
+RESIZE_DEBOUNCE_MS = 200
+_pending_resize = None  # (width, height, ticks of the last resize event)
+
+def request_resize(width, height):
+    """Record a VIDEORESIZE; the layout is rebuilt by apply_pending_resize once it settles"""
+    global _pending_resize
+    _pending_resize = (width, height, pygame.time.get_ticks())
+
+def apply_pending_resize(force=False):
+    global _pending_resize, screen, SCREEN_WIDTH, SCREEN_HEIGHT, SCALE, WINDOW_WIDTH, WINDOW_HEIGHT, LETTERBOX_X, LETTERBOX_Y
+    if _pending_resize is None:
+        return False
+    width, height, requested_at = _pending_resize
+    if not force and pygame.time.get_ticks() - requested_at < RESIZE_DEBOUNCE_MS:
+        return False
+    _pending_resize = None
+    SCREEN_WIDTH, SCREEN_HEIGHT = width, height
+    SCALE = min(SCREEN_WIDTH / BASE_WIDTH, SCREEN_HEIGHT / BASE_HEIGHT)
+    WINDOW_WIDTH = max(1, int(BASE_WIDTH * SCALE))
+    WINDOW_HEIGHT = max(1, int(BASE_HEIGHT * SCALE))
+    LETTERBOX_X = (SCREEN_WIDTH - WINDOW_WIDTH) // 2
+    LETTERBOX_Y = (SCREEN_HEIGHT - WINDOW_HEIGHT) // 2
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
+    return True
+
+# Window-resolution surfaces used by render_to_screen, one bucket per window size.
+# A few recent buckets are kept so going back to an earlier size costs nothing.
+PRESENT_CACHE_SIZE = 3
+_present_cache = OrderedDict()
+
+def get_present_buffers():
+    key = (SCREEN_WIDTH, SCREEN_HEIGHT)
+    buffers = _present_cache.get(key)
+    if buffers is None:
+        buffers = build_present_buffers()
+        _present_cache[key] = buffers
+        while len(_present_cache) > PRESENT_CACHE_SIZE:
+            _present_cache.popitem(last=False)
+    else:
+        _present_cache.move_to_end(key)
+    return buffers
+
+def build_present_buffers():
     # Clear the screen with a subtle pattern
-    screen.fill((20, 20, 20))  # Dark gray instead of pure black
+    backdrop = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+    backdrop.fill((20, 20, 20))  # Dark gray instead of pure black
     
     # Add subtle pattern to letterbox areas
     if LETTERBOX_X > 0 or LETTERBOX_Y > 0:
@@ -92,28 +383,205 @@ def render_to_screen():
         for x in range(0, SCREEN_WIDTH, 40):
             for y in range(0, SCREEN_HEIGHT, 40):
                 if (x + y) % 80 == 0:
-                    pygame.draw.circle(screen, (30, 30, 30), (x, y), 1)
+                    pygame.draw.circle(backdrop, (30, 30, 30), (x, y), 1)
     
-    # Scale the virtual surface to maintain aspect ratio
-    scaled_surface = pygame.transform.smoothscale(virtual_surface, (WINDOW_WIDTH, WINDOW_HEIGHT))
+    return {
+        'backdrop': backdrop,
+        # Scale targets share the virtual surface's format so transforms can write into them
+        'scaled': pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT), 0, virtual_surface),
+        'reduced': {},
+    }
+
+def render_to_screen(source=None):
+    """Scale the virtual surface to screen with responsive scaling"""
+    show_scaled(scale_frame(source))
+
+def scale_frame(source=None):
+    """Scale a virtual frame into the window-sized buffer. Touches no display state,
+    so the render pipeline's worker can run it. Returns the buffers for show_scaled."""
+    if source is None:
+        source = virtual_surface
+    buffers = get_present_buffers()
     
+    # Scale the virtual surface to maintain aspect ratio
+    settings = quality_governor.settings
+    window_size = (WINDOW_WIDTH, WINDOW_HEIGHT)
+    scaled_surface = buffers['scaled']
+    if not settings['smooth_scale']:
+        pygame.transform.scale(source, window_size, scaled_surface)
+    elif settings['render_scale'] < 1:
+        reduced_surface = buffers['reduced'].get(settings['render_scale'])
+        if reduced_surface is None:
+            reduced_size = (max(1, int(WINDOW_WIDTH * settings['render_scale'])),
+                            max(1, int(WINDOW_HEIGHT * settings['render_scale'])))
+            reduced_surface = pygame.Surface(reduced_size, 0, virtual_surface)
+            buffers['reduced'][settings['render_scale']] = reduced_surface
+        pygame.transform.smoothscale(source, reduced_surface.get_size(), reduced_surface)
+        pygame.transform.scale(reduced_surface, window_size, scaled_surface)
+    else:
+        pygame.transform.smoothscale(source, window_size, scaled_surface)
+    return buffers
+
+def show_scaled(buffers):
+    """Letterbox a scaled frame onto the display surface (main thread only)"""
+    screen.blit(buffers['backdrop'], (0, 0))
     # Center the scaled surface on the screen
-    screen.blit(scaled_surface, (LETTERBOX_X, LETTERBOX_Y))
+    screen.blit(buffers['scaled'], (LETTERBOX_X, LETTERBOX_Y))
+
+class RenderPipeline:
+    """Scales frame N on a worker thread while the main thread simulates and
+    draws frame N+1.
+
+    The main thread draws into one of two virtual surfaces; submit() hands it
+    to the worker and points virtual_surface at the other one. Before handing
+    over, submit() waits for the worker to finish scaling the previous frame
+    and shows that one, so only one frame is ever in flight and what is on
+    screen is one frame behind. Everything that touches the window (the
+    display blits, flip, set_mode on resize) stays on the main thread, as SDL
+    requires; the worker only writes the off-screen scale buffers, which the
+    main thread leaves alone while a frame is in flight. pygame's transforms
+    release the GIL, so on multi-core machines the scaling mostly leaves the
+    main thread's critical path.
+    """
+    def __init__(self):
+        self.buffers = [virtual_surface, pygame.Surface((BASE_WIDTH, BASE_HEIGHT), 0, virtual_surface)]
+        self.back = 0  # buffer the main thread is drawing into
+        self.frame = None
+        self.scaled = None  # buffers holding the worker's last finished frame
+        self.submitted = threading.Semaphore(0)
+        self.presented = threading.Semaphore(1)
+        self.running = False
+        self.thread = None
+        self.present_ms = 0.0  # worker time spent scaling the last frame
+        self.wait_ms = 0.0     # main thread time spent waiting for the worker
+
+    def start(self):
+        global virtual_surface
+        virtual_surface = self.buffers[self.back]
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="render-pipeline", daemon=True)
+        self.thread.start()
+
+    def submit(self):
+        global virtual_surface
+        start = time.perf_counter()
+        self.presented.acquire()
+        self.wait_ms = (time.perf_counter() - start) * 1000
+        # The worker is idle until released, so its buffers can be shown and the display rebuilt
+        self._show_finished()
+        apply_pending_resize()
+        self.frame = self.buffers[self.back]
+        self.submitted.release()
+        self.back ^= 1
+        virtual_surface = self.buffers[self.back]
+
+    def flush(self):
+        """Wait for the frame in flight and show it now, for a frame that has to stay on screen"""
+        self.presented.acquire()
+        self._show_finished()
+        self.presented.release()
+
+    def _show_finished(self):
+        if self.scaled is not None:
+            show_scaled(self.scaled)
+            pygame.display.flip()
+            self.scaled = None
 
+    def _run(self):
+        while True:
+            self.submitted.acquire()
+            if not self.running:
+                break
+            start = time.perf_counter()
+            self.scaled = scale_frame(self.frame)
+            self.present_ms = (time.perf_counter() - start) * 1000
+            self.presented.release()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.presented.acquire()
+        self.running = False
+        self.submitted.release()
+        self.thread.join()
+        self.presented.release()
+
+render_pipeline = None
+
+def enable_render_pipeline():
+    global render_pipeline
+    if render_pipeline is None:
+        render_pipeline = RenderPipeline()
+        render_pipeline.start()
+
+def present_frame(hold=False):
+    """Show the finished virtual surface, directly or through the render pipeline.
+    With hold, the frame is on screen when this returns, even when pipelined,
+    for callers that block with it showing."""
+    if render_pipeline is not None:
+        render_pipeline.submit()
+        if hold:
+            render_pipeline.flush()
+        return
+    apply_pending_resize()
+    render_to_screen()
+    pygame.display.flip()
+
+def quit_game():
+    global render_pipeline, run_store
+    flush_log()
+    stop_profile_capture()
+    if run_store is not None:
+        run_store.close()
+        run_store = None
+    if render_pipeline is not None:
+        render_pipeline.stop()
+        render_pipeline = None
+    pygame.quit()
+    sys.exit()
+
+# Sprites and fonts are drawn onto the virtual surface, so they are built once
+# at virtual size; only render_to_screen works at window resolution.
 def load_image(name, scale=1):
     try:
         image = pygame.image.load(name)
         if scale != 1:
-            # Scale based on the virtual resolution scaling
-            final_scale = scale * SCALE
             image = pygame.transform.scale(image, 
-                (int(image.get_width() * final_scale), int(image.get_height() * final_scale)))
+                (int(image.get_width() * scale), int(image.get_height() * scale)))
         return image
     except Exception as e:
         print(f"Error loading image {name}: {e}")
         return None
 
+# Decoded GIF frames keyed by (path, target width); entities share the lists.
+# Collision masks for the same frames are cached under the same key.
+_gif_frame_cache = {}
+_gif_mask_cache = {}
+_gif_bounds_cache = {}
+
 def load_gif_frames(gif_path, target_width=None):
+    key = (gif_path, target_width)
+    if key not in _gif_frame_cache:
+        _gif_frame_cache[key] = _decode_gif_frames(gif_path, target_width)
+    return _gif_frame_cache[key]
+
+def load_gif_masks(gif_path, target_width=None):
+    key = (gif_path, target_width)
+    if key not in _gif_mask_cache:
+        frames = load_gif_frames(gif_path, target_width)
+        _gif_mask_cache[key] = [pygame.mask.from_surface(frame) for frame in frames] if frames else None
+    return _gif_mask_cache[key]
+
+def load_gif_bounds(gif_path, target_width=None):
+    """Rect around the opaque pixels of every frame, relative to the frame's top-left"""
+    key = (gif_path, target_width)
+    if key not in _gif_bounds_cache:
+        masks = load_gif_masks(gif_path, target_width)
+        rects = [rect for mask in masks or () for rect in mask.get_bounding_rects()]
+        _gif_bounds_cache[key] = rects[0].unionall(rects[1:]) if rects else None
+    return _gif_bounds_cache[key]
+
+def _decode_gif_frames(gif_path, target_width=None):
     try:
         gif = Image.open(gif_path)
         frames = []
@@ -124,8 +592,7 @@ def load_gif_frames(gif_path, target_width=None):
                 frame.tobytes(), frame.size, frame.mode)
             
             if target_width:
-                # Scale based on the virtual resolution scaling
-                scale = (target_width * SCALE) / frame_surface.get_width()
+                scale = target_width / frame_surface.get_width()
                 new_size = (int(frame_surface.get_width() * scale),
                           int(frame_surface.get_height() * scale))
                 frame_surface = pygame.transform.scale(frame_surface, new_size)
@@ -137,15 +604,23 @@ def load_gif_frames(gif_path, target_width=None):
         return None
 
 try:
-    font = pygame.font.Font(os.path.join(ASSET_DIR, "assets/fonts/space_font.ttf"), int(36 * SCALE))
-    small_font = pygame.font.Font(os.path.join(ASSET_DIR, "assets/fonts/space_font.ttf"), int(24 * SCALE))
+    font = pygame.font.Font(os.path.join(ASSET_DIR, "assets/fonts/space_font.ttf"), 36)
+    small_font = pygame.font.Font(os.path.join(ASSET_DIR, "assets/fonts/space_font.ttf"), 24)
 except:
-    font = pygame.font.SysFont(None, int(36 * SCALE))
-    small_font = pygame.font.SysFont(None, int(24 * SCALE))
+    font = pygame.font.SysFont(None, 36)
+    small_font = pygame.font.SysFont(None, 24)
+
+_font_cache = {}
+
+def get_font(size):
+    """Default pygame font at a virtual size, built once per size"""
+    if size not in _font_cache:
+        _font_cache[size] = pygame.font.Font(None, size)
+    return _font_cache[size]
 
 try:
     player_image = pygame.image.load(os.path.join(ASSET_DIR, "robo.gif")).convert_alpha()
-    player_image = pygame.transform.scale(player_image, (int(PLAYER_WIDTH * SCALE), int(PLAYER_HEIGHT * SCALE)))
+    player_image = pygame.transform.scale(player_image, (PLAYER_WIDTH, PLAYER_HEIGHT))
     enemy_image = pygame.image.load(os.path.join(ASSET_DIR, "enemy.gif")).convert_alpha()
     coin_sprite = load_image(os.path.join(ASSET_DIR, "coin.png"), 0.3)
     powerup_sprites = {
@@ -158,7 +633,206 @@ except:
     coin_sprite = None
     powerup_sprites = None
 
-high_score = 0
+# Run history and leaderboard, opened by game_loop
+run_store = None
+
+def open_run_store(path=RUNS_DB_PATH):
+    global run_store
+    try:
+        run_store = runstore.RunStore(path)
+    except sqlite3.Error as e:
+        print(f"Error opening run history {path}: {e}")
+
+def best_score():
+    return run_store.best_score if run_store is not None else 0
+
+# Shape masks for entities drawn with primitives, built once per size
+_shape_mask_cache = {}
+
+def get_rect_mask(width, height, border_radius=0):
+    key = ('rect', width, height, border_radius)
+    if key not in _shape_mask_cache:
+        if border_radius:
+            shape = pygame.Surface((width, height), pygame.SRCALPHA)
+            pygame.draw.rect(shape, WHITE, (0, 0, width, height), border_radius=border_radius)
+            _shape_mask_cache[key] = pygame.mask.from_surface(shape)
+        else:
+            _shape_mask_cache[key] = pygame.Mask((width, height), fill=True)
+    return _shape_mask_cache[key]
+
+def get_circle_mask(radius):
+    key = ('circle', radius)
+    if key not in _shape_mask_cache:
+        shape = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        pygame.draw.circle(shape, WHITE, (radius, radius), radius)
+        _shape_mask_cache[key] = pygame.mask.from_surface(shape)
+    return _shape_mask_cache[key]
+
+# Pre-rendered sprites for entities drawn with primitives, keyed by shape and colour,
+# least recently used first. A game uses about 115 keys (36 powerup glow sizes per
+# type, 3 powerup bodies, a few circles), so the limit only bites on odd sizes.
+_sprite_cache = OrderedDict()
+SPRITE_CACHE_SIZE = 256
+
+def cached_sprite(key):
+    """Sprite stored under key, marked as just used, or None"""
+    sprite = _sprite_cache.get(key)
+    if sprite is not None:
+        _sprite_cache.move_to_end(key)
+    return sprite
+
+def trim_sprite_cache(limit=SPRITE_CACHE_SIZE):
+    """Drop the least recently used sprites once the cache outgrows limit"""
+    while len(_sprite_cache) > limit:
+        _sprite_cache.popitem(last=False)
+
+def get_circle_sprite(radius, color, inner_color=None, inner_radius=0):
+    """Circle sprite to blit at (x - radius, y - radius), same pixels as draw.circle at (x, y)"""
+    key = ('circle', radius, color, inner_color, inner_radius)
+    sprite = cached_sprite(key)
+    if sprite is None:
+        sprite = pygame.Surface((radius * 2 + 1, radius * 2 + 1), pygame.SRCALPHA)
+        pygame.draw.circle(sprite, color, (radius, radius), radius)
+        if inner_color is not None:
+            pygame.draw.circle(sprite, inner_color, (radius, radius), inner_radius)
+        _sprite_cache[key] = sprite
+    return sprite
+
+# Render layers, back to front. The screen shake copy happens after LAYER_EFFECTS.
+LAYER_EFFECTS = 0
+LAYER_OBSTACLES = 1
+LAYER_LASERS = 2
+LAYER_COINS = 3
+LAYER_POWERUPS = 4
+LAYER_GHOSTS = 5
+LAYER_PLAYER = 6
+
+class RenderQueue:
+    """Draw calls collected per layer and submitted back to front.
+
+    Consecutive sprite blits in a layer go out as one Surface.blits() call.
+    Primitives that can't be pre-rendered are queued as callables and run in
+    submission order between those batches. Anything whose bounds miss the
+    viewport is dropped when it is submitted.
+    """
+    def __init__(self, viewport):
+        self.viewport = viewport
+        self.layers = {}
+        # Counts since the last reset_stats(), for the debug overlay
+        self.sprites = 0
+        self.calls = 0
+        self.batches = 0
+        self.culled = 0
+
+    def blit(self, layer, image, pos):
+        x, y = pos
+        width, height = image.get_size()
+        viewport = self.viewport
+        if x >= viewport.right or y >= viewport.bottom or x + width <= viewport.left or y + height <= viewport.top:
+            self.culled += 1
+            return
+        items = self.layers.get(layer)
+        if items is None:
+            items = self.layers[layer] = []
+        items.append((image, pos))
+
+    def extend(self, layer, items):
+        """Queue (image, pos) pairs that are known to be on screen, without testing each one"""
+        layer_items = self.layers.get(layer)
+        if layer_items is None:
+            layer_items = self.layers[layer] = []
+        layer_items.extend(items)
+
+    def call(self, layer, bounds, func, *args):
+        """Queue func(surface, *args). Calls without bounds are never culled."""
+        if bounds is not None and not self.viewport.colliderect(bounds):
+            self.culled += 1
+            return
+        items = self.layers.get(layer)
+        if items is None:
+            items = self.layers[layer] = []
+        items.append((None, (func, args)))
+
+    def flush(self, surface, upto=None):
+        """Draw and drop every queued layer, or only those up to and including upto"""
+        for layer in sorted(self.layers):
+            if upto is not None and layer > upto:
+                break
+            batch = []
+            for image, item in self.layers.pop(layer):
+                if image is not None:
+                    batch.append((image, item))
+                    continue
+                if batch:
+                    surface.blits(batch, doreturn=False)
+                    self.sprites += len(batch)
+                    self.batches += 1
+                    batch = []
+                func, args = item
+                func(surface, *args)
+                self.calls += 1
+            if batch:
+                surface.blits(batch, doreturn=False)
+                self.sprites += len(batch)
+                self.batches += 1
+
+    def reset_stats(self):
+        self.sprites = self.calls = self.batches = self.culled = 0
+
+render_queue = RenderQueue(pygame.Rect(0, 0, WIDTH, HEIGHT))
+
+def masks_overlap(rect_a, mask_a, rect_b, mask_b):
+    """Pixel-accurate collision test; the rect check rejects most pairs before touching the masks"""
+    if not rect_a.colliderect(rect_b):
+        return False
+    return mask_a.overlap(mask_b, (rect_b.x - rect_a.x, rect_b.y - rect_a.y)) is not None
+
+# Largest gap, in pixels of relative motion, between mask tests along a sweep.
+# The thinnest masks (laser beam, bullets) are over twice this.
+SWEEP_SAMPLE_PX = 4
+
+def swept_masks_overlap(rect_a, mask_a, rect_b, mask_b, motion):
+    """Pixel-accurate collision over a whole step instead of only at its end.
+
+    rect_a and rect_b are end-of-step positions and motion is how far b moved
+    relative to a during the step. The boxes' entry and exit times come from a
+    swept AABB test, and the masks are only sampled between them.
+    """
+    vx, vy = motion
+    if not vx and not vy:
+        return masks_overlap(rect_a, mask_a, rect_b, mask_b)
+    if not rect_a.colliderect(rect_b.union(rect_b.move(-vx, -vy))):
+        return False
+
+    # Offset of b from a at fraction t of the step is end - (1 - t) * motion
+    end_x = rect_b.x - rect_a.x
+    end_y = rect_b.y - rect_a.y
+    enter, leave = 0.0, 1.0
+    for end, v, size_a, size_b in ((end_x, vx, rect_a.width, rect_b.width),
+                                   (end_y, vy, rect_a.height, rect_b.height)):
+        start = end - v
+        if v == 0:
+            if start >= size_a or start + size_b <= 0:
+                return False
+            continue
+        # Boxes overlap on this axis while -size_b < start + v * t < size_a
+        t0 = (-size_b - start) / v
+        t1 = (size_a - start) / v
+        if t0 > t1:
+            t0, t1 = t1, t0
+        enter = max(enter, t0)
+        leave = min(leave, t1)
+        if enter >= leave:
+            return False
+
+    samples = int(max(abs(vx), abs(vy)) * (leave - enter) / SWEEP_SAMPLE_PX) + 1
+    for i in range(samples + 1):
+        # The last sample is exactly the end position when the overlap lasts to the end of the step
+        t = leave if i == samples else enter + (leave - enter) * i / samples
+        offset = (round(end_x - (1 - t) * vx), round(end_y - (1 - t) * vy))
+        if mask_a.overlap(mask_b, offset) is not None:
+            return True
+    return False
 
 def check_overlap(rect, game_objects, buffer=20):
     expanded_rect = pygame.Rect(rect.x - buffer, rect.y - buffer, 
@@ -179,32 +853,173 @@ def check_overlap(rect, game_objects, buffer=20):
                 return True
     return False
 
-def find_safe_spawn_position(width, height, game_objects, max_attempts=10):
+def find_safe_spawn_position(width, height, game_objects, max_attempts=10, rng=random):
     for _ in range(max_attempts):
-        x = random.randint(width, WIDTH - width)
+        x = rng.randint(width, WIDTH - width)
         y = -height
         rect = pygame.Rect(x, y, width, height)
         if not check_overlap(rect, game_objects, buffer=30):
             return x, y
     return None, None
 
-def ensure_safe_path(game_objects):
-    lane_width = WIDTH // 3
-    lanes = [0, lane_width, lane_width * 2]
-    
-    for lane in lanes:
-        lane_rect = pygame.Rect(lane, 0, lane_width, HEIGHT)
-        has_obstacle = False
-        
-        for obj in game_objects:
-            if hasattr(obj, 'rect') and lane_rect.colliderect(obj.rect):
-                has_obstacle = True
-                break
-        
-        if not has_obstacle:
-            return True
-    
-    return False
+GRID_CELL = 24  # Occupancy grid cell size in pixels
+
+def fill_runs(seeds, free):
+    """Every bit of free connected to a seed through a run of adjacent free bits"""
+    fill = seeds & free
+    for direction in (1, -1):
+        grown, carry = fill, free
+        shift = 1
+        # Doubling steps: after each one, grown covers runs up to twice as long
+        while shift < free.bit_length():
+            if direction == 1:
+                grown |= carry & (grown << shift)
+                carry &= carry << shift
+            else:
+                grown |= carry & (grown >> shift)
+                carry &= carry >> shift
+            shift *= 2
+        fill |= grown
+    return fill
+
+class OccupancyGrid:
+    """Where the player can still get through the drones and lasers ahead.
+
+    Hazards never move relative to each other, so the grid lives in a world
+    frame that scrolls with them. Each hazard is stamped once when it spawns
+    and unstamped when it leaves. A row is an int bitmask of the columns where
+    the player's top-left corner would touch a hazard. Collisions use masks, so
+    hazards are stamped by the box around their opaque pixels and inflated by
+    the same box of the player sprite (player_bounds, relative to its rect).
+
+    The search starts from every free column of the lowest row the player can
+    stand on and runs toward the newest row. The player moves as fast as the
+    screen scrolls, so from one row to the next it can shift one column either
+    way. It can also move down with the scroll to hold its place among the
+    hazards, so within a row it reaches the whole run of free columns it
+    enters. That ignores how much screen is left below the player to wait in,
+    which errs toward letting a spawn through. Reachable rows are cached and
+    only recomputed from the lowest row a change touches. A spawn check
+    therefore costs a bounded number of rows, however many entities are alive.
+    """
+    def __init__(self, player_width, player_height, player_bounds=None):
+        self.player_width = player_width
+        self.player_height = player_height
+        self.player_bounds = player_bounds or pygame.Rect(0, 0, player_width, player_height)
+        self.columns = (WIDTH - player_width) // GRID_CELL + 1
+        self.full = (1 << self.columns) - 1
+        self.offset = 0.0  # Pixels scrolled since the grid was created
+        self.stamps = {}   # hazard -> {row: bits}
+        self.rows = {}     # row -> {hazard: bits}
+        self.blocked = {}  # row -> OR of the row's bits, only for rows with hazards
+        # Rows from reach_start down to valid_from have up-to-date reachable sets
+        self.reach = {}
+        self.reach_start = None
+        self.valid_from = None
+
+    def advance(self, pixels):
+        self.offset += pixels
+
+    def start_row(self):
+        return math.floor((HEIGHT - self.player_height - self.offset) / GRID_CELL)
+
+    def cells(self, hazard):
+        """{row: column bits} blocked for the player's top-left corner by hazard"""
+        cells = {}
+        for top, bottom, left, right in hazard.occupied_spans(GRID_CELL):
+            # Positions, offset and laser band edges pile up float steps, so round away the noise before snapping to cells
+            top = round(top - self.offset, 6)
+            bottom = round(bottom - self.offset, 6)
+            left = round(left, 6)
+            right = round(right, 6)
+            # The player's opaque box touches the span while its corner is inside the open intervals
+            # (top - bounds.bottom, bottom - bounds.top) and (left - bounds.right, right - bounds.left)
+            box = self.player_bounds
+            first_row = math.floor((top - box.bottom) / GRID_CELL)
+            last_row = math.ceil((bottom - box.top) / GRID_CELL) - 1
+            first_column = max(0, math.floor((left - box.right) / GRID_CELL))
+            last_column = min(self.columns - 1, math.ceil((right - box.left) / GRID_CELL) - 1)
+            if first_column > last_column:
+                continue
+            bits = ((1 << (last_column - first_column + 1)) - 1) << first_column
+            for row in range(first_row, last_row + 1):
+                cells[row] = cells.get(row, 0) | bits
+        return cells
+
+    def add(self, hazard, cells=None):
+        if cells is None:
+            cells = self.cells(hazard)
+        self.stamps[hazard] = cells
+        for row, bits in cells.items():
+            self.rows.setdefault(row, {})[hazard] = bits
+            self.blocked[row] = self.blocked.get(row, 0) | bits
+        self.invalidate(cells)
+
+    def remove(self, hazard):
+        cells = self.stamps.pop(hazard, None)
+        if cells is None:
+            return
+        for row in cells:
+            hazards = self.rows[row]
+            del hazards[hazard]
+            if hazards:
+                bits = 0
+                for other in hazards.values():
+                    bits |= other
+                self.blocked[row] = bits
+            else:
+                del self.rows[row]
+                del self.blocked[row]
+        self.invalidate(cells)
+
+    def invalidate(self, cells):
+        if cells and self.valid_from is not None:
+            self.valid_from = max(self.valid_from, max(cells) + 1)
+
+    def try_add(self, hazard):
+        """Stamp hazard only if a way through everything ahead remains"""
+        cells = self.cells(hazard)
+        if not self.path_exists(cells):
+            return False
+        self.add(hazard, cells)
+        return True
+
+    def path_exists(self, extra=None):
+        """Whether the player can get past the newest hazard, with extra cells blocked too"""
+        extra = extra or {}
+        start = self.start_row()
+        if start != self.reach_start:
+            # The lowest row moved: rows behind it no longer matter and the cache starts over
+            for row in [row for row in self.rows if row > start]:
+                for hazard in self.rows[row]:
+                    del self.stamps[hazard][row]
+                del self.rows[row]
+                del self.blocked[row]
+            self.reach = {}
+            self.reach_start = start
+            self.valid_from = start + 1
+
+        extra_top = max(extra) if extra else None
+        frontier = min(min(self.blocked, default=start), min(extra, default=start))
+        blocked = self.blocked
+        # Resume from the lowest cached row the extra cells can't affect
+        row = self.valid_from if extra_top is None else max(self.valid_from, extra_top + 1)
+        if row <= start:
+            reach = self.reach[row]
+        else:
+            row = start
+            reach = self.full & ~(blocked.get(row, 0) | extra.get(row, 0))
+            if extra_top is None or row > extra_top:
+                self.reach[row] = reach
+                self.valid_from = row
+        while reach and row > frontier:
+            row -= 1
+            free = self.full & ~(blocked.get(row, 0) | extra.get(row, 0))
+            reach = fill_runs(reach | reach << 1 | reach >> 1, free)
+            if row == self.valid_from - 1 and (extra_top is None or row > extra_top):
+                self.reach[row] = reach
+                self.valid_from = row
+        return reach != 0
 
 class SpriteSheet:
     def __init__(self, image):
@@ -217,40 +1032,66 @@ class SpriteSheet:
         return image
 
 class Animation:
-    def __init__(self, frames, speed=0.1):
+    def __init__(self, frames, speed=0.1, masks=None):
         self.frames = frames
+        self.masks = masks
         self.speed = speed
         self.index = 0
         self.timer = 0
 
-    def update(self):
-        self.timer += self.speed
-        if self.timer >= 1:
-            self.timer = 0
-            self.index = (self.index + 1) % len(self.frames)
+    def update(self, dt=1):
+        # Step per tick, so a multi-tick update lands on the same frame as single ticks would
+        for _ in range(round(dt)):
+            self.timer += self.speed
+            if self.timer >= 1:
+                self.timer = 0
+                self.index = (self.index + 1) % len(self.frames)
 
     def get_current_frame(self):
         return self.frames[int(self.index)]
 
+    def get_current_mask(self):
+        return self.masks[int(self.index)]
+
+    def get_state(self):
+        return (self.index, self.timer)
+
+    def set_state(self, state):
+        self.index, self.timer = state
+
 class Background:
     def __init__(self):
         self.bg_image = pygame.Surface((WIDTH, HEIGHT))
+        self.bg_dark = None  # Colour scheme currently drawn into bg_image
         self.scroll = 0
         self.flip_timer = 0
         self.flip_x = False
         self.flip_y = False
 
-    def update(self, speed, distance):
-        self.scroll = (self.scroll + speed/2) % HEIGHT
-        self.flip_timer += 1
+    def update(self, speed, distance, dt=1):
+        self.scroll = (self.scroll + speed/2 * dt) % HEIGHT
+        self.flip_timer += dt
         
         if self.flip_timer >= 120:
             self.flip_timer = 0
-            self.flip_x = random.random() < 0.5
-            self.flip_y = random.random() < 0.5
+            self.flip_x = fx_random.random() < 0.5
+            self.flip_y = fx_random.random() < 0.5
+
+    def get_state(self):
+        return (self.scroll, self.flip_timer, self.flip_x, self.flip_y)
+
+    def set_state(self, state):
+        self.scroll, self.flip_timer, self.flip_x, self.flip_y = state
 
     def draw(self, surface, distance):
         is_dark = (int(distance) // 400) % 2 == 0
+        if is_dark != self.bg_dark:
+            self.bg_dark = is_dark
+            self.render_grid(is_dark)
+        surface.blits(((self.bg_image, (0, self.scroll)),
+                       (self.bg_image, (0, self.scroll - HEIGHT))), doreturn=False)
+
+    def render_grid(self, is_dark):
         bg_color = DARK_GREY if is_dark else LIGHT_GREY
         line_color = (50, 50, 50) if is_dark else (150, 150, 150)
         
@@ -267,54 +1108,68 @@ class Background:
                 if (x // 100 + y // 100) % 2 == 0:
                     pygame.draw.line(self.bg_image, line_color, (x-10, y-10), (x+10, y+10), 1)
                     pygame.draw.line(self.bg_image, line_color, (x-10, y+10), (x+10, y-10), 1)
-        
-        surface.blit(self.bg_image, (0, self.scroll))
-        surface.blit(self.bg_image, (0, self.scroll - HEIGHT))
 
 class Bullet:
     def __init__(self, x, y):
         self.x = x
         self.y = y
         self.speed = 10
-        self.radius = int(5 * SCALE)
+        self.radius = 5
         self.rect = pygame.Rect(x - self.radius, y - self.radius, self.radius * 2, self.radius * 2)
         self.trail_particles = []
         self.active = True
 
-    def update(self):
-        self.y -= self.speed
+    def update(self, dt=1):
+        self.y -= self.speed * dt
         self.rect.y = self.y - self.radius
         
         # Add trail particles
-        if random.random() < 0.3:
+        if fx_random.random() < quality_governor.settings['bullet_trail']:
             self.trail_particles.append({
-                'x': self.x + random.randint(-2, 2),
-                'y': self.y + random.randint(-2, 2),
+                'x': self.x + fx_random.randint(-2, 2),
+                'y': self.y + fx_random.randint(-2, 2),
                 'life': 10
             })
         
         # Update trail particles
         for particle in self.trail_particles[:]:
-            particle['life'] -= 1
+            particle['life'] -= dt
             if particle['life'] <= 0:
                 self.trail_particles.remove(particle)
 
-    def draw(self, surface):
-        # Draw trail particles
+    def submit(self, queue):
+        # Trail particles; the screen has no alpha channel, so they are drawn opaque
+        particle_sprite = get_circle_sprite(2, (100, 200, 255))
         for particle in self.trail_particles:
-            alpha = int(255 * (particle['life'] / 10))
-            color = (100, 200, 255, alpha)
-            pygame.draw.circle(surface, color, (int(particle['x']), int(particle['y'])), 2)
+            queue.blit(LAYER_EFFECTS, particle_sprite, (int(particle['x']) - 2, int(particle['y']) - 2))
         
-        # Draw bullet
-        pygame.draw.circle(surface, BLUE, (int(self.x), int(self.y)), self.radius)
-        pygame.draw.circle(surface, WHITE, (int(self.x), int(self.y)), self.radius - 2)
+        # Bullet
+        sprite = get_circle_sprite(self.radius, BLUE, WHITE, self.radius - 2)
+        queue.blit(LAYER_EFFECTS, sprite, (int(self.x) - self.radius, int(self.y) - self.radius))
+
+    def get_mask(self):
+        return get_circle_mask(self.radius)
+
+    def get_state(self):
+        trail = tuple((p['x'], p['y'], p['life']) for p in self.trail_particles)
+        return (self.x, self.y, self.rect.x, self.rect.y, self.active, trail)
+
+    @classmethod
+    def from_state(cls, state):
+        x, y, rect_x, rect_y, active, trail = state
+        bullet = cls(x, y)
+        bullet.rect.topleft = (rect_x, rect_y)
+        bullet.active = active
+        bullet.trail_particles = [{'x': px, 'y': py, 'life': life} for px, py, life in trail]
+        return bullet
 
 class Player:
     def __init__(self):
         self.target_width = 120
         
-        self.animation = Animation(load_gif_frames(os.path.join(ASSET_DIR, "robo.gif"), self.target_width))
+        gif_path = os.path.join(ASSET_DIR, "robo.gif")
+        self.animation = Animation(load_gif_frames(gif_path, self.target_width),
+                                   masks=load_gif_masks(gif_path, self.target_width))
         if self.animation and self.animation.frames:
             first_frame = self.animation.frames[0]
             self.width = first_frame.get_width()
@@ -323,6 +1178,8 @@ class Player:
             self.width = self.target_width
             self.height = self.target_width
             print("Warning: Using fallback player dimensions")
+        # Opaque part of the sprite within self.rect, so the occupancy grid inflates hazards by what can collide
+        self.bounds = load_gif_bounds(gif_path, self.target_width) or pygame.Rect(0, 0, self.width, self.height)
         
         self.rect = pygame.Rect(WIDTH//2 - self.width//2, HEIGHT-100, 
                               self.width, self.height)
@@ -338,38 +1195,45 @@ class Player:
         self.last_shot_time = 0
         self.shoot_cooldown = 300  # milliseconds
 
-    def get_hitbox(self):
-        shrink = self.width // 5
-        return pygame.Rect(self.rect.x + shrink, self.rect.y + shrink,
-                          self.width - 2*shrink, self.height - 2*shrink)
+    def get_mask(self):
+        """Mask of the frame currently shown, aligned with self.rect"""
+        if self.animation and self.animation.masks:
+            return self.animation.get_current_mask()
+        return get_rect_mask(self.rect.width, self.rect.height)
 
-    def move(self, keys):
+    def move(self, keys, dt=1):
+        step = self.speed * dt
         # Arrow keys and WASD controls
         if keys[pygame.K_LEFT] or keys[pygame.K_a]:
-            self.rect.x = max(0, self.rect.x - self.speed)
+            self.rect.x = max(0, self.rect.x - step)
         if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-            self.rect.x = min(WIDTH - self.width, self.rect.x + self.speed)
+            self.rect.x = min(WIDTH - self.width, self.rect.x + step)
         if keys[pygame.K_UP] or keys[pygame.K_w]:
-            self.rect.y = max(0, self.rect.y - self.speed)
+            self.rect.y = max(0, self.rect.y - step)
         if keys[pygame.K_DOWN] or keys[pygame.K_s]:
-            self.rect.y = min(HEIGHT - self.height, self.rect.y + self.speed)
+            self.rect.y = min(HEIGHT - self.height, self.rect.y + step)
 
-    def draw(self, surface):
+    def update(self, dt=1):
+        """Advance the animation and hit flash; collisions use the frame this leaves current"""
         if self.hit_timer > 0:
-            self.hit_timer -= 1
-            if self.hit_timer % 4 < 2:
-                return
+            self.hit_timer = max(0, self.hit_timer - dt)
+        if self.animation and self.animation.frames:
+            self.animation.update(dt)
+
+    def submit(self, queue):
+        if self.hit_timer > 0 and self.hit_timer % 4 < 2:
+            return
 
         if self.animation and self.animation.frames:
-            self.animation.update()
-            surface.blit(self.animation.get_current_frame(), self.rect.topleft)
+            queue.blit(LAYER_PLAYER, self.animation.get_current_frame(), self.rect.topleft)
         else:
             color = GREEN if self.invincible else BLUE
-            pygame.draw.rect(surface, color, self.rect)
+            queue.call(LAYER_PLAYER, self.rect, pygame.draw.rect, color, self.rect.copy())
 
-    def update_powerup(self):
+    def update_powerup(self, current_time=None):
         if self.invincible or self.magnet or self.can_shoot:
-            current_time = pygame.time.get_ticks()
+            if current_time is None:
+                current_time = pygame.time.get_ticks()
             if current_time - self.powerup_timer > 10000:  # 10 seconds
                 if self.invincible:
                     self.invincible = False
@@ -382,20 +1246,42 @@ class Player:
                     return "Bullet Power Expired!"
         return None
 
-    def shoot(self):
-        current_time = pygame.time.get_ticks()
+    def shoot(self, current_time=None):
+        if current_time is None:
+            current_time = pygame.time.get_ticks()
         if self.can_shoot and current_time - self.last_shot_time >= self.shoot_cooldown:
             self.last_shot_time = current_time
             return Bullet(self.rect.centerx, self.rect.top)
         return None
 
+    def get_state(self):
+        animation_state = self.animation.get_state() if self.animation else (0, 0)
+        return (self.rect.x, self.rect.y, self.speed, self.base_speed, self.invincible,
+                self.magnet, self.can_shoot, self.powerup_timer, self.coins_collected,
+                self.distance_travelled, self.hit_timer, self.last_shot_time, animation_state)
+
+    @classmethod
+    def from_state(cls, state):
+        player = cls()
+        (player.rect.x, player.rect.y, player.speed, player.base_speed, player.invincible,
+         player.magnet, player.can_shoot, player.powerup_timer, player.coins_collected,
+         player.distance_travelled, player.hit_timer, player.last_shot_time,
+         animation_state) = state
+        if player.animation:
+            player.animation.set_state(animation_state)
+        return player
+
 class Obstacle:
     def __init__(self, x, y, type='drone'):
         self.type = type
+        # Exact position, so drones scroll in step with lasers and coins instead of by rounded speeds
+        self.y = y
         if type == 'drone':
             self.target_width = 144
             
-            self.animation = Animation(load_gif_frames(os.path.join(ASSET_DIR, "enemy.gif"), self.target_width))
+            gif_path = os.path.join(ASSET_DIR, "enemy.gif")
+            self.animation = Animation(load_gif_frames(gif_path, self.target_width),
+                                       masks=load_gif_masks(gif_path, self.target_width))
             if self.animation and self.animation.frames:
                 first_frame = self.animation.frames[0]
                 self.width = first_frame.get_width()
@@ -404,30 +1290,51 @@ class Obstacle:
                 self.width = self.target_width
                 self.height = self.target_width
                 print("Warning: Using fallback enemy dimensions")
+            self.bounds = load_gif_bounds(gif_path, self.target_width) or pygame.Rect(0, 0, self.width, self.height)
             
             self.rect = pygame.Rect(x, y, self.width, self.height)
-            self.hitbox = pygame.Rect(x + self.width//4, y + self.height//4, 
-                                    self.width//2, self.height//2)
         else:
             self.animation = None
-            self.width = int(45 * SCALE)
-            self.height = int(45 * SCALE)
+            self.width = 45
+            self.height = 45
+            self.bounds = pygame.Rect(0, 0, self.width, self.height)
             self.rect = pygame.Rect(x, y, self.width, self.height)
-            self.hitbox = self.rect
 
-    def update(self, speed):
-        self.rect.y += speed
-        if self.type == 'drone':
-            self.hitbox.x = self.rect.x + self.width//4
-            self.hitbox.y = self.rect.y + self.height//4
+    def update(self, speed, dt=1):
+        self.y += speed * dt
+        self.rect.y = self.y
+        if self.type == 'drone' and self.animation and self.animation.frames:
+            self.animation.update(dt)
 
-    def draw(self, surface):
+    def submit(self, queue):
         if self.type == 'drone' and self.animation and self.animation.frames:
-            self.animation.update()
-            surface.blit(self.animation.get_current_frame(), self.rect.topleft)
+            queue.blit(LAYER_OBSTACLES, self.animation.get_current_frame(), self.rect.topleft)
         else:
             if self.type == 'drone':
-                pygame.draw.rect(surface, MAGENTA, self.rect)
+                queue.call(LAYER_OBSTACLES, self.rect, pygame.draw.rect, MAGENTA, self.rect.copy())
+
+    def get_mask(self):
+        if self.animation and self.animation.masks:
+            return self.animation.get_current_mask()
+        return get_rect_mask(self.rect.width, self.rect.height)
+
+    def occupied_spans(self, band):
+        """(top, bottom, left, right) screen areas this hazard covers, for OccupancyGrid"""
+        # Only the opaque box of the animation can collide, whichever frame is showing
+        top = self.y + self.bounds.top
+        return [(top, top + self.bounds.height, self.rect.left + self.bounds.left, self.rect.left + self.bounds.right)]
+
+    def get_state(self):
+        animation_state = self.animation.get_state() if self.animation else (0, 0)
+        return (self.type, self.rect.x, self.y, animation_state)
+
+    @classmethod
+    def from_state(cls, state):
+        type, x, y, animation_state = state
+        obstacle = cls(x, y, type)
+        if obstacle.animation:
+            obstacle.animation.set_state(animation_state)
+        return obstacle
 
 class Laser:
     def __init__(self, x1, y1, x2, y2):
@@ -450,26 +1357,34 @@ class Laser:
         self.pulse_speed = 0.2
         self.hitbox = pygame.Rect(min(x1, x2) - 5, min(y1, y2) - 5,
                                 abs(x2 - x1) + 10, abs(y2 - y1) + 10)
+        self.beam_mask = None
 
-    def update(self, speed):
-        self.y1 += speed
-        self.y2 += speed
+    def update(self, speed, dt=1):
+        self.y1 += speed * dt
+        self.y2 += speed * dt
         self.box1.y = self.y1 - 10
         self.box2.y = self.y2 - 10
-        self.hitbox.y += speed
-        self.pulse_timer += self.pulse_speed
+        self.hitbox.y += speed * dt
+        self.pulse_timer += self.pulse_speed * dt
+
+    def submit(self, queue):
+        # Glow, pulse and sparkles change every frame, so the beam stays a deferred draw
+        bounds = self.box1.union(self.box2).union(self.hitbox).inflate(20, 20)
+        queue.call(LAYER_LASERS, bounds, self.draw)
 
     def draw(self, surface):
+        settings = quality_governor.settings
         pulse = abs(math.sin(self.pulse_timer)) * 0.3 + 0.7
         
         for box in [self.box1, self.box2]:
-            glow_surface = pygame.Surface((box.width + 20, box.height + 20), pygame.SRCALPHA)
-            glow_color = (255, 0, 0, int(100 * pulse))
-            pygame.draw.rect(glow_surface, glow_color, 
-                           (10, 10, box.width, box.height),
-                           border_radius=10)
-            surface.blit(glow_surface, 
-                       (box.x - 10, box.y - 10))
+            if settings['laser_glow_passes'] > 0:
+                glow_surface = pygame.Surface((box.width + 20, box.height + 20), pygame.SRCALPHA)
+                glow_color = (255, 0, 0, int(100 * pulse))
+                pygame.draw.rect(glow_surface, glow_color, 
+                               (10, 10, box.width, box.height),
+                               border_radius=10)
+                surface.blit(glow_surface, 
+                           (box.x - 10, box.y - 10))
             
             pygame.draw.rect(surface, RED, box, border_radius=10)
             
@@ -478,21 +1393,73 @@ class Laser:
             pygame.draw.rect(surface, highlight_color, highlight_rect, border_radius=8)
         
         points = [(self.x1, self.y1), (self.x2, self.y2)]
-        for width in range(8, 3, -1):
+        for width in range(3 + settings['laser_glow_passes'], 3, -1):
             alpha = int(100 * pulse * (width / 8))
             color = (255, 0, 0, alpha)
             pygame.draw.line(surface, color, points[0], points[1], width)
         
         pygame.draw.line(surface, RED, points[0], points[1], 4)
         
-        for _ in range(3):
-            t = random.random()
+        for _ in range(settings['laser_sparkles']):
+            t = fx_random.random()
             x = self.x1 + (self.x2 - self.x1) * t
             y = self.y1 + (self.y2 - self.y1) * t
-            particle_radius = random.randint(2, 4)
+            particle_radius = fx_random.randint(2, 4)
             pygame.draw.circle(surface, (255, 200, 200), (int(x), int(y)), particle_radius)
 
-    def collides_with(self, rect):
+    def get_mask(self):
+        """Mask of every point closer than 6px to the beam, built on first use"""
+        if self.beam_mask is None:
+            width = int(abs(self.x2 - self.x1)) + 13
+            height = int(abs(self.y2 - self.y1)) + 13
+            origin_x = min(self.x1, self.x2) - 6
+            origin_y = min(self.y1, self.y2) - 6
+            start = (self.x1 - origin_x, self.y1 - origin_y)
+            end = (self.x2 - origin_x, self.y2 - origin_y)
+            beam = pygame.Surface((width, height), pygame.SRCALPHA)
+            pygame.draw.line(beam, WHITE, start, end, 11)
+            pygame.draw.circle(beam, WHITE, start, 5)
+            pygame.draw.circle(beam, WHITE, end, 5)
+            self.beam_mask = pygame.mask.from_surface(beam)
+        return self.beam_mask
+
+    def occupied_spans(self, band):
+        """(top, bottom, left, right) screen areas this hazard covers, for OccupancyGrid.
+
+        The beam is cut into horizontal bands of the given height, each as wide
+        as the part of the beam (6px either side, 10 around the end boxes) in it.
+        """
+        spans = []
+        top = min(self.y1, self.y2) - 10
+        bottom = max(self.y1, self.y2) + 10
+        while top < bottom:
+            band_bottom = min(top + band, bottom)
+            if self.y1 == self.y2:
+                xa, xb = self.x1, self.x2
+            else:
+                t0 = max(0, min(1, (top - 6 - self.y1) / (self.y2 - self.y1)))
+                t1 = max(0, min(1, (band_bottom + 6 - self.y1) / (self.y2 - self.y1)))
+                xa = self.x1 + (self.x2 - self.x1) * t0
+                xb = self.x1 + (self.x2 - self.x1) * t1
+            spans.append((top, band_bottom, min(xa, xb) - 10, max(xa, xb) + 10))
+            top = band_bottom
+        return spans
+
+    def get_mask_rect(self):
+        # Same size as get_mask() builds, without building it
+        return pygame.Rect(int(min(self.x1, self.x2)) - 6, int(min(self.y1, self.y2)) - 6,
+                           int(abs(self.x2 - self.x1)) + 13, int(abs(self.y2 - self.y1)) + 13)
+
+    def collides_with(self, rect, mask=None, motion=(0, 0)):
+        """Beam against a rect, or pixel-accurate against a mask aligned with that rect.
+
+        With a mask, motion is how far the rect moved relative to the beam
+        during the step, and the whole path is tested.
+        """
+        if mask is not None:
+            # Equivalent to the beam moving by -motion past a still rect
+            return swept_masks_overlap(rect, mask, self.get_mask_rect(), self.get_mask(),
+                                       (-motion[0], -motion[1]))
         line_rect = pygame.Rect(min(self.x1, self.x2) - 5, min(self.y1, self.y2) - 5,
                               abs(self.x2 - self.x1) + 10, abs(self.y2 - self.y1) + 10)
         if not line_rect.colliderect(rect):
@@ -519,26 +1486,57 @@ class Laser:
                 return True
         return False
 
+    def get_state(self):
+        return (self.x1, self.y1, self.x2, self.y2, tuple(self.box1), tuple(self.box2),
+                tuple(self.hitbox), self.pulse_timer)
+
+    @classmethod
+    def from_state(cls, state):
+        # Bypass __init__ so the already clamped endpoints are kept exactly
+        laser = cls.__new__(cls)
+        laser.x1, laser.y1, laser.x2, laser.y2, box1, box2, hitbox, laser.pulse_timer = state
+        laser.box1 = pygame.Rect(box1)
+        laser.box2 = pygame.Rect(box2)
+        laser.hitbox = pygame.Rect(hitbox)
+        laser.pulse_speed = 0.2
+        laser.beam_mask = None
+        return laser
+
 class Coin:
     def __init__(self, x, y):
         self.x = x
         self.y = y
         self.collected = False
-        self.radius = int(COIN_RADIUS * SCALE)
+        self.radius = COIN_RADIUS
         self.rect = pygame.Rect(x - self.radius, y - self.radius, self.radius*2, self.radius*2)
         self.sprite = coin_sprite
 
-    def update(self, speed):
-        self.y += speed
+    def update(self, speed, dt=1):
+        self.y += speed * dt
         self.rect.y = self.y - self.radius
 
-    def draw(self, surface):
+    def submit(self, queue):
         if not self.collected:
             if self.sprite:
-                surface.blit(self.sprite, (self.x - self.sprite.get_width()//2, 
-                                        self.y - self.sprite.get_height()//2))
+                queue.blit(LAYER_COINS, self.sprite, (self.x - self.sprite.get_width()//2, 
+                                                     self.y - self.sprite.get_height()//2))
             else:
-                pygame.draw.circle(surface, YELLOW, (self.x, self.y), self.radius)
+                queue.blit(LAYER_COINS, get_circle_sprite(self.radius, YELLOW),
+                           (int(self.x) - self.radius, int(self.y) - self.radius))
+
+    def get_mask(self):
+        return get_circle_mask(self.radius)
+
+    def get_state(self):
+        return (self.x, self.y, self.collected, self.rect.x, self.rect.y)
+
+    @classmethod
+    def from_state(cls, state):
+        x, y, collected, rect_x, rect_y = state
+        coin = cls(x, y)
+        coin.collected = collected
+        coin.rect.topleft = (rect_x, rect_y)
+        return coin
 
 class Explosion:
     def __init__(self, x, y):
@@ -549,24 +1547,28 @@ class Explosion:
         self.create_particles()
 
     def create_particles(self):
-        for _ in range(20):
-            angle = random.uniform(0, 2 * math.pi)
-            speed = random.uniform(2, 5)
+        for _ in range(quality_governor.settings['explosion_particles']):
+            angle = fx_random.uniform(0, 2 * math.pi)
+            speed = fx_random.uniform(2, 5)
             self.particles.append({
                 'x': self.x,
                 'y': self.y,
                 'dx': math.cos(angle) * speed,
                 'dy': math.sin(angle) * speed,
                 'life': self.lifetime,
-                'color': (random.randint(200, 255), random.randint(100, 200), 0)
+                'color': (fx_random.randint(200, 255), fx_random.randint(100, 200), 0)
             })
 
-    def update(self):
+    def update(self, dt=1):
         for particle in self.particles:
-            particle['x'] += particle['dx']
-            particle['y'] += particle['dy']
-            particle['life'] -= 1
-            particle['dy'] += 0.1  # gravity effect
+            particle['x'] += particle['dx'] * dt
+            particle['y'] += particle['dy'] * dt
+            particle['life'] -= dt
+            particle['dy'] += 0.1 * dt  # gravity effect
+
+    def submit(self, queue):
+        # Debris has no fixed bounds, so explosions are never culled
+        queue.call(LAYER_EFFECTS, None, self.draw)
 
     def draw(self, surface):
         for particle in self.particles:
@@ -577,9 +1579,23 @@ class Explosion:
                                  (int(particle['x']), int(particle['y'])), 
                                  int(particle['life'] / 10) + 1)
 
+    def get_state(self):
+        particles = tuple((p['x'], p['y'], p['dx'], p['dy'], p['life'], tuple(p['color']))
+                          for p in self.particles)
+        return (self.x, self.y, self.lifetime, particles)
+
+    @classmethod
+    def from_state(cls, state):
+        # Bypass __init__ so restoring does not roll new particles
+        explosion = cls.__new__(cls)
+        explosion.x, explosion.y, explosion.lifetime, particles = state
+        explosion.particles = [{'x': x, 'y': y, 'dx': dx, 'dy': dy, 'life': life, 'color': tuple(color)}
+                               for x, y, dx, dy, life, color in particles]
+        return explosion
+
 class PowerUp:
     def __init__(self, x, y, type='invincibility'):
-        powerup_size = int(45 * SCALE)
+        powerup_size = 45
         self.rect = pygame.Rect(x, y, powerup_size, powerup_size)
         self.type = type
         self.active = False
@@ -590,34 +1606,42 @@ class PowerUp:
         self.rotation = 0
         self.rotation_speed = 2
 
-    def update(self, speed):
-        self.rect.y += speed
+    def update(self, speed, dt=1):
+        self.rect.y += speed * dt
         if self.animation:
-            self.animation.update()
+            self.animation.update(dt)
         
-        self.pulse_timer += self.pulse_speed
-        self.rotation = (self.rotation + self.rotation_speed) % 360
-
-    def draw(self, surface):
+        self.pulse_timer += self.pulse_speed * dt
+        self.rotation = (self.rotation + self.rotation_speed * dt) % 360
+
+    def submit(self, queue):
+        settings = quality_governor.settings
+        if settings['powerup_glow']:
+            queue.call(LAYER_POWERUPS, self.rect.inflate(60, 60), self.draw_glow)
+        queue.blit(LAYER_POWERUPS, self.get_body_sprite(), self.rect.topleft)
+        if settings['powerup_border']:
+            # The spinning border stays outside the icon, so drawing it after the body looks the same
+            queue.call(LAYER_POWERUPS, self.rect.inflate(12, 12), self.draw_border)
+
+    def draw_glow(self, surface):
         pulse = abs(math.sin(self.pulse_timer)) * 0.3 + 0.7
-        
         glow_radius = int(30 * pulse)
-        glow_surface = pygame.Surface((self.rect.width + glow_radius*2, 
-                                     self.rect.height + glow_radius*2), 
-                                    pygame.SRCALPHA)
         glow_color = (*self.color, int(100 * pulse))
-        pygame.draw.rect(glow_surface, glow_color, 
-                        (glow_radius, glow_radius, self.rect.width, self.rect.height),
-                        border_radius=12)
+        # Only a few dozen distinct glows per type, so they are cached rather than built every frame
+        key = ('powerup glow', glow_color, glow_radius, self.rect.size)
+        glow_surface = cached_sprite(key)
+        if glow_surface is None:
+            glow_surface = pygame.Surface((self.rect.width + glow_radius*2, 
+                                         self.rect.height + glow_radius*2), 
+                                        pygame.SRCALPHA)
+            pygame.draw.rect(glow_surface, glow_color, 
+                            (glow_radius, glow_radius, self.rect.width, self.rect.height),
+                            border_radius=12)
+            _sprite_cache[key] = glow_surface
         surface.blit(glow_surface, 
                    (self.rect.x - glow_radius, self.rect.y - glow_radius))
-        
-        pygame.draw.rect(surface, self.color, self.rect, border_radius=12)
-        
-        highlight_rect = self.rect.inflate(-6, -6)
-        highlight_color = tuple(min(c + 50, 255) for c in self.color)
-        pygame.draw.rect(surface, highlight_color, highlight_rect, border_radius=9)
-        
+
+    def draw_border(self, surface):
         border_points = []
         center = self.rect.center
         radius = max(self.rect.width, self.rect.height) // 2 + 3
@@ -628,38 +1652,69 @@ class PowerUp:
             border_points.append((x, y))
         
         pygame.draw.lines(surface, WHITE, True, border_points, 3)
+
+    def get_body_sprite(self):
+        """Body and icon, which only depend on the type, rendered once per type"""
+        key = ('powerup', self.type, self.color, self.rect.size)
+        sprite = cached_sprite(key)
+        if sprite is not None:
+            return sprite
+        sprite = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        rect = sprite.get_rect()
+        pygame.draw.rect(sprite, self.color, rect, border_radius=12)
+        
+        highlight_rect = rect.inflate(-6, -6)
+        highlight_color = tuple(min(c + 50, 255) for c in self.color)
+        pygame.draw.rect(sprite, highlight_color, highlight_rect, border_radius=9)
         
         if self.type == 'invincibility':
             shield_points = [
-                (self.rect.centerx, self.rect.top + 8),
-                (self.rect.right - 8, self.rect.centery),
-                (self.rect.centerx, self.rect.bottom - 8),
-                (self.rect.left + 8, self.rect.centery)
+                (rect.centerx, rect.top + 8),
+                (rect.right - 8, rect.centery),
+                (rect.centerx, rect.bottom - 8),
+                (rect.left + 8, rect.centery)
             ]
-            pygame.draw.polygon(surface, WHITE, shield_points, 3)
+            pygame.draw.polygon(sprite, WHITE, shield_points, 3)
         elif self.type == 'magnet':
             magnet_width = 12
             magnet_height = 18
-            magnet_x = self.rect.centerx - magnet_width//2
-            magnet_y = self.rect.centery - magnet_height//2
-            pygame.draw.rect(surface, WHITE, 
+            magnet_x = rect.centerx - magnet_width//2
+            magnet_y = rect.centery - magnet_height//2
+            pygame.draw.rect(sprite, WHITE, 
                            (magnet_x, magnet_y, magnet_width, magnet_height), 3)
             for i in range(3):
                 y = magnet_y + magnet_height + i * 6
-                pygame.draw.line(surface, WHITE,
+                pygame.draw.line(sprite, WHITE,
                                (magnet_x - 6, y),
                                (magnet_x + magnet_width + 6, y), 2)
         elif self.type == 'bullet':
             # Draw bullet icon
             bullet_length = 20
             bullet_width = 8
-            pygame.draw.rect(surface, WHITE,
-                           (self.rect.centerx - bullet_width//2,
-                            self.rect.centery - bullet_length//2,
+            pygame.draw.rect(sprite, WHITE,
+                           (rect.centerx - bullet_width//2,
+                            rect.centery - bullet_length//2,
                             bullet_width, bullet_length), 0)
-            pygame.draw.circle(surface, WHITE,
-                             (self.rect.centerx, self.rect.centery - bullet_length//2),
+            pygame.draw.circle(sprite, WHITE,
+                             (rect.centerx, rect.centery - bullet_length//2),
                              bullet_width//2)
+        _sprite_cache[key] = sprite
+        return sprite
+
+    def get_mask(self):
+        return get_rect_mask(self.rect.width, self.rect.height, border_radius=12)
+
+    def get_state(self):
+        return (self.rect.x, self.rect.y, self.type, self.active, self.pulse_timer, self.rotation)
+
+    @classmethod
+    def from_state(cls, state):
+        x, y, type, active, pulse_timer, rotation = state
+        powerup = cls(x, y, type)
+        powerup.active = active
+        powerup.pulse_timer = pulse_timer
+        powerup.rotation = rotation
+        return powerup
 
 def display_text(text, size, x, y, color=WHITE, surface=None):
     if surface is None:
@@ -668,19 +1723,66 @@ def display_text(text, size, x, y, color=WHITE, surface=None):
     label = font_to_use.render(text, True, color)
     surface.blit(label, (x, y))
 
+def draw_debug_overlay(surface=None, extra_lines=()):
+    """Frame timing and current quality level, toggled with F3"""
+    if surface is None:
+        surface = virtual_surface
+    lines = [
+        f"FPS: {clock.get_fps():.0f}",
+        f"Frame: {clock.get_rawtime()} ms / {quality_governor.budget_ms:.1f} ms",
+        f"Quality: {quality_governor.settings['name']} ({quality_governor.level})",
+        *extra_lines,
+    ]
+    for i, line in enumerate(lines):
+        label = small_font.render(line, True, YELLOW)
+        surface.blit(label, (WIDTH - label.get_width() - 10, 10 + i * 25))
+
+ATTRACT_IDLE_MS = 20000  # Start screen idle time before the autopilot demo starts
+
+def attract_mode():
+    """Autopilot demo run shown while the start screen sits idle. Any key ends it."""
+    state = GameState()
+    autopilot = Autopilot()
+    while True:
+        clock.tick(FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                quit_game()
+            if event.type == pygame.VIDEORESIZE:
+                request_resize(event.w, event.h)
+            if event.type == pygame.KEYDOWN:
+                return
+        keys, shoot = autopilot.plan(state)
+        if shoot:
+            state.shoot()
+        if state.update(keys):
+            return
+        virtual_surface.fill(BLACK)
+        state.draw(virtual_surface)
+        banner = font.render("DEMO - Press any key", True, YELLOW)
+        virtual_surface.blit(banner, (WIDTH//2 - banner.get_width()//2, HEIGHT//3))
+        present_frame()
+
 def start_screen():
     """Display the start screen with title, controls, and instructions"""
+    idle_since = pygame.time.get_ticks()
+    # Indexed queries, so this stays quick however long the history is
+    top_runs = run_store.top_scores(3) if run_store is not None else []
+    summary = run_store.summary() if run_store is not None else None
     while True:
+        if pygame.time.get_ticks() - idle_since > ATTRACT_IDLE_MS:
+            attract_mode()
+            idle_since = pygame.time.get_ticks()
         virtual_surface.fill(BLACK)
         
         # Title
-        title_font = pygame.font.Font(None, 72)
+        title_font = get_font(72)
         title_text = title_font.render("RoboRun", True, WHITE)
         title_rect = title_text.get_rect(center=(WIDTH//2, HEIGHT//4))
         virtual_surface.blit(title_text, title_rect)
         
         # Controls
-        controls_font = pygame.font.Font(None, 36)
+        controls_font = get_font(36)
         controls_text = [
             "Controls:",
             "Arrow Keys or WASD - Move",
@@ -692,60 +1794,67 @@ def start_screen():
         for i, text in enumerate(controls_text):
             color = YELLOW if i == 0 else WHITE
             font_size = 36 if i == 0 else 28
-            text_surface = pygame.font.Font(None, font_size).render(text, True, color)
+            text_surface = get_font(font_size).render(text, True, color)
             text_rect = text_surface.get_rect(center=(WIDTH//2, y_offset + i * 35))
             virtual_surface.blit(text_surface, text_rect)
         
         # Instructions
-        instruction_font = pygame.font.Font(None, 48)
+        instruction_font = get_font(48)
         instruction_text = instruction_font.render("Press R to Play", True, GREEN)
         instruction_rect = instruction_text.get_rect(center=(WIDTH//2, HEIGHT - 100))
         virtual_surface.blit(instruction_text, instruction_rect)
         
-        # High score
-        if high_score > 0:
-            high_score_text = pygame.font.Font(None, 32).render(f"High Score: {high_score}", True, GREY)
-            high_score_rect = high_score_text.get_rect(center=(WIDTH//2, HEIGHT - 50))
-            virtual_surface.blit(high_score_text, high_score_rect)
+        # Leaderboard and run history
+        if top_runs:
+            best_text = "Best: " + "   ".join(f"{i}. {run['score']}" for i, run in enumerate(top_runs, 1))
+            best_surface = get_font(32).render(best_text, True, YELLOW)
+            best_rect = best_surface.get_rect(center=(WIDTH//2, HEIGHT - 170))
+            virtual_surface.blit(best_surface, best_rect)
+        if summary and summary['runs']:
+            stats_text = (f"Runs: {summary['runs']}   Median: {summary['median']}   "
+                          f"Top 10%: {summary['p90']}   Coins: {summary['coins']}")
+            stats_surface = get_font(32).render(stats_text, True, GREY)
+            stats_rect = stats_surface.get_rect(center=(WIDTH//2, HEIGHT - 50))
+            virtual_surface.blit(stats_surface, stats_rect)
         
-        render_to_screen()
-        pygame.display.flip()
+        present_frame()
+        frame_scheduler.run_idle()
         
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                quit_game()
+            if event.type == pygame.VIDEORESIZE:
+                request_resize(event.w, event.h)
             if event.type == pygame.KEYDOWN:
+                idle_since = pygame.time.get_ticks()
                 if event.key == pygame.K_r:
                     return
                 elif event.key == pygame.K_q:
-                    pygame.quit()
-                    sys.exit()
+                    quit_game()
 
 def game_over_menu(score):
-    global high_score
-    if score > high_score:
-        high_score = score
+    # The run may still be waiting in the writer queue
+    high_score = max(score, best_score())
     while True:
         virtual_surface.fill(BLACK)
         display_text("Game Over", 64, WIDTH//3, HEIGHT//4, RED)
         display_text(f"Score: {score}", 36, WIDTH//3, HEIGHT//3)
         display_text(f"High Score: {high_score}", 36, WIDTH//3, HEIGHT//3 + 40)
         display_text("Press R to Restart or Q to Quit", 32, WIDTH//4, HEIGHT//2)
-        render_to_screen()
-        pygame.display.flip()
+        present_frame()
+        frame_scheduler.run_idle()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
+                quit_game()
+            if event.type == pygame.VIDEORESIZE:
+                request_resize(event.w, event.h)
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_r:
                     return "restart"
                 elif event.key == pygame.K_q:
-                    pygame.quit()
-                    sys.exit()
+                    quit_game()
 
-def spawn_coin_line(base_x, obstacles, lasers, powerups, coins):
+def spawn_coin_line(base_x, obstacles, lasers, powerups, coins, rng=random):
     coin_spacing = 50
     coin_line_length = 5
     vertical_spacing = 40
@@ -753,7 +1862,7 @@ def spawn_coin_line(base_x, obstacles, lasers, powerups, coins):
     for i in range(coin_line_length):
         attempts = 0
         while attempts < 5:
-            cx = base_x + random.randint(-10, 10)
+            cx = base_x + rng.randint(-10, 10)
             cy = -i * vertical_spacing
             # Create a temporary coin to get the scaled radius
             temp_coin = Coin(cx, cy)
@@ -764,8 +1873,994 @@ def spawn_coin_line(base_x, obstacles, lasers, powerups, coins):
                 break
             attempts += 1
 
-def game_loop():
+class VirtualKeys(dict):
+    """Stand-in for pygame.key.get_pressed() when input comes from a script or bot"""
+    def __missing__(self, key):
+        return False
+
+class GameState:
+    """Everything a run needs to continue from a given tick.
+
+    Time is counted in simulation ticks rather than wall-clock milliseconds, and
+    gameplay randomness comes from self.rng, so a snapshot fully determines what
+    happens next.
+    """
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.randrange(2**32)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.player = Player()
+        self.obstacles = []
+        self.lasers = []
+        self.coins = []
+        self.powerups = []
+        self.bullets = []
+        self.explosions = []
+        self.background = Background()
+        self.ticks = 0
+        self.base_speed = 5  # Initial base speed
+        self.scroll_speed = self.base_speed
+        self.spawn_timer = 0
+        self.laser_timer = 0
+        self.coin_line_timer = 0
+        self.last_checkpoint = 0
+        self.difficulty_level = 1
+        self.screen_shake = 0
+        self.powerup_text = None
+        self.powerup_text_timer = 0
+        self.speed_multiplier = 1.0  # Base speed multiplier
+        self.death_cause = None
+        self.events = []
+        self.grid = None
+
+    @property
+    def time_ms(self):
+        return self.ticks * 1000 / FPS
+
+    def occupancy(self):
+        """Occupancy grid of the live hazards, built on first use after a restore"""
+        if self.grid is None:
+            self.grid = OccupancyGrid(self.player.width, self.player.height, self.player.bounds)
+            for hazard in self.obstacles + self.lasers:
+                self.grid.add(hazard)
+        return self.grid
+
+    def shoot(self):
+        bullet = self.player.shoot(self.time_ms)
+        if bullet:
+            self.bullets.append(bullet)
+
+    def update(self, keys, dt=1):
+        """Advance the simulation by dt ticks. Returns the death cause, if any.
+
+        Collisions and pickups are swept over the whole step, and checkpoints
+        are detected by the distance interval crossed. Larger steps, for
+        fast-forward or headless runs, therefore don't skip anything that
+        happens between ticks.
+        """
+        self.events = []
+        self.ticks += dt
+        player = self.player
+
+        # Increase speed by 1% every second of play
+        time_elapsed = self.ticks / FPS
+        speed_scale = 1.0 + (time_elapsed * 0.01)
+        current_speed = self.base_speed * speed_scale * self.speed_multiplier
+        self.scroll_speed = current_speed
+        player.speed = current_speed  # Player speed matches game speed
+
+        self.background.update(self.scroll_speed, player.distance_travelled, dt)
+        start_x, start_y = player.rect.topleft
+        player.move(keys, dt)
+        player.update(dt)
+        player_dx = player.rect.x - start_x
+        player_dy = player.rect.y - start_y
+
+        self.spawn_timer += dt
+        self.laser_timer += dt
+        self.coin_line_timer += dt
+
+        # Every checkpoint passed since the last one counts, even when no tick lands exactly on it
+        reached = int(player.distance_travelled) // CHECKPOINT_DISTANCE * CHECKPOINT_DISTANCE
+        if reached > self.last_checkpoint:
+            self.difficulty_level += (reached - self.last_checkpoint) // CHECKPOINT_DISTANCE
+            self.last_checkpoint = reached
+            p_type = self.rng.choice(['invincibility', 'magnet', 'bullet'])
+            px, py = find_safe_spawn_position(30, 30, self.obstacles + self.lasers + self.powerups + self.coins, rng=self.rng)
+            if px is not None:
+                self.powerups.append(PowerUp(px, py, p_type))
+            self.events.append('checkpoint')
+
+        expired_text = player.update_powerup(self.time_ms)
+        if expired_text:
+            self.powerup_text = expired_text
+            self.powerup_text_timer = 60
+            if "Invincibility" in expired_text:
+                self.speed_multiplier = 1.0  # Reset speed multiplier when invincibility expires
+            elif "Magnet" in expired_text:
+                player.magnet = False
+            elif "Bullet" in expired_text:
+                player.can_shoot = False
+
+        # Timers keep their remainder and fire once per interval they cover, so spawn rates don't depend on the step size
+        while self.spawn_timer > 60:
+            self.spawn_timer -= 61
+            x, y = find_safe_spawn_position(144, 144, self.obstacles + self.lasers + self.powerups + self.coins, rng=self.rng)
+            if x is not None:
+                new_obstacle = Obstacle(x, y, 'drone')
+                if self.occupancy().try_add(new_obstacle):
+                    self.obstacles.append(new_obstacle)
+
+            if self.rng.random() < 0.1:
+                p_type = self.rng.choice(['invincibility', 'magnet', 'bullet'])
+                px, py = find_safe_spawn_position(30, 30, self.obstacles + self.lasers + self.powerups + self.coins, rng=self.rng)
+                if px is not None:
+                    self.powerups.append(PowerUp(px, py, p_type))
+
+        for bullet in self.bullets[:]:
+            bullet_start_y = bullet.rect.y
+            bullet.update(dt)
+            bullet_dy = bullet.rect.y - bullet_start_y
+            
+            # Check for bullet collisions with obstacles. Drones scroll later this tick, so the
+            # bullet is swept against where each drone ends up, along their relative motion.
+            hit = False
+            for obstacle in self.obstacles[:]:
+                obstacle_end = obstacle.rect.copy()
+                obstacle_end.y = obstacle.y + self.scroll_speed * dt
+                motion = (0, bullet_dy - (obstacle_end.y - obstacle.rect.y))
+                if swept_masks_overlap(obstacle_end, obstacle.get_mask(), bullet.rect, bullet.get_mask(), motion):
+                    self.explosions.append(Explosion(obstacle.rect.centerx, obstacle.rect.centery))
+                    self.obstacles.remove(obstacle)
+                    if self.grid is not None:
+                        self.grid.remove(obstacle)
+                    self.bullets.remove(bullet)
+                    hit = True
+                    break
+            
+            # Remove bullets that are off screen
+            if not hit and bullet.y < -bullet.radius:
+                self.bullets.remove(bullet)
+
+        for explosion in self.explosions[:]:
+            explosion.update(dt)
+            if explosion.particles[0]['life'] <= 0:
+                self.explosions.remove(explosion)
+
+        while self.laser_timer > 180:
+            self.laser_timer -= 181
+            for _ in range(5):
+                x1 = self.rng.randint(50, WIDTH - 50)
+                x2 = self.rng.randint(50, WIDTH - 50)
+                y1 = -20
+                y2 = y1 - self.rng.randint(60, HEIGHT//2)
+                new_laser = Laser(x1, y1, x2, y2)
+                if not check_overlap(new_laser.hitbox, self.obstacles + self.lasers + self.powerups + self.coins, buffer=30):
+                    if self.occupancy().try_add(new_laser):
+                        self.lasers.append(new_laser)
+                        break
+
+        while self.coin_line_timer > 90:
+            self.coin_line_timer -= 91
+            base_x = self.rng.randint(100, WIDTH - 100)
+            spawn_coin_line(base_x, self.obstacles, self.lasers, self.powerups, self.coins, rng=self.rng)
+
+        player.distance_travelled += self.scroll_speed * dt / FPS
+
+        if self.screen_shake > 0:
+            self.screen_shake = max(0, self.screen_shake - dt)
+
+        if self.grid is not None:
+            self.grid.advance(self.scroll_speed * dt)
+
+        # Each entity is tested along its motion relative to the player during the step.
+        # Whatever the player can touch this step ends up inside reach, which rejects
+        # everything else with a single rect test.
+        player_mask = player.get_mask()
+        reach = player.rect.inflate(2 * abs(player_dx) + 4,
+                                    2 * (abs(player_dy) + int(self.scroll_speed * dt)) + 4)
+
+        for obs in self.obstacles:
+            start_y = obs.rect.y
+            obs.update(self.scroll_speed, dt)
+            if not player.invincible and reach.colliderect(obs.rect):
+                motion = (-player_dx, obs.rect.y - start_y - player_dy)
+                if swept_masks_overlap(player.rect, player_mask, obs.rect, obs.get_mask(), motion):
+                    self.kill_player('drone')
+
+        for laser in self.lasers:
+            start_y = int(min(laser.y1, laser.y2))
+            laser.update(self.scroll_speed, dt)
+            if not player.invincible and reach.colliderect(laser.get_mask_rect()):
+                motion = (player_dx, player_dy - (int(min(laser.y1, laser.y2)) - start_y))
+                if laser.collides_with(player.rect, player_mask, motion):
+                    self.kill_player('laser')
+
+        for coin in self.coins:
+            start_y = coin.rect.y
+            coin.update(self.scroll_speed, dt)
+            motion = (-player_dx, coin.rect.y - start_y - player_dy)
+            if (not coin.collected and reach.colliderect(coin.rect)
+                    and swept_masks_overlap(player.rect, player_mask, coin.rect, coin.get_mask(), motion)):
+                coin.collected = True
+                player.coins_collected += 1
+                self.events.append('coin')
+            if player.magnet and not coin.collected:
+                if abs(coin.x - player.rect.centerx) < 100:
+                    # A fifth of the remaining way each tick
+                    for _ in range(max(1, round(dt))):
+                        coin.x += (player.rect.centerx - coin.x) // 5
+                        coin.y += (player.rect.centery - coin.y) // 5
+                    coin.rect.x = coin.x - COIN_RADIUS
+                    coin.rect.y = coin.y - COIN_RADIUS
+
+        for p in self.powerups[:]:
+            start_y = p.rect.y
+            p.update(self.scroll_speed, dt)
+            motion = (-player_dx, p.rect.y - start_y - player_dy)
+            if reach.colliderect(p.rect) and swept_masks_overlap(player.rect, player_mask, p.rect, p.get_mask(), motion):
+                if p.type == 'invincibility':
+                    player.invincible = True
+                    self.speed_multiplier = 3.0  # Triple the overall game speed
+                    self.powerup_text = "Invincibility Activated!"
+                elif p.type == 'magnet':
+                    player.magnet = True
+                    self.powerup_text = "Magnet Power Activated!"
+                elif p.type == 'bullet':
+                    player.can_shoot = True
+                    self.powerup_text = "Bullet Power Activated!"
+                player.powerup_timer = self.time_ms
+                self.powerup_text_timer = 60
+                self.powerups.remove(p)
+                self.events.append('powerup')
+
+        if self.powerup_text and self.powerup_text_timer > 0:
+            self.powerup_text_timer = max(0, self.powerup_text_timer - dt)
+
+        self.prune()
+        return self.death_cause
+
+    def prune(self):
+        """Drop entities that scrolled past the bottom of the screen or were collected"""
+        obstacles = [o for o in self.obstacles if o.rect.top <= HEIGHT]
+        lasers = [l for l in self.lasers if min(l.y1, l.y2) - 10 <= HEIGHT]
+        if self.grid is not None and len(obstacles) + len(lasers) < len(self.obstacles) + len(self.lasers):
+            for hazard in set(self.obstacles + self.lasers).difference(obstacles + lasers):
+                self.grid.remove(hazard)
+        self.obstacles = obstacles
+        self.lasers = lasers
+        self.coins = [c for c in self.coins if not c.collected and c.y - c.radius <= HEIGHT]
+        self.powerups = [p for p in self.powerups if p.rect.top <= HEIGHT]
+
+    def kill_player(self, cause):
+        if self.death_cause is None:
+            self.death_cause = cause
+            self.events.append(cause + '_collision')
+        self.player.hit_timer = 30
+        self.screen_shake = 10
+
+    def draw(self, surface, ghosts=None):
+        self.background.draw(surface, self.player.distance_travelled)
+
+        queue = render_queue
+        queue.reset_stats()
+        for bullet in self.bullets:
+            bullet.submit(queue)
+        for explosion in self.explosions:
+            explosion.submit(queue)
+        for obs in self.obstacles:
+            obs.submit(queue)
+        for laser in self.lasers:
+            laser.submit(queue)
+        for coin in self.coins:
+            coin.submit(queue)
+        for p in self.powerups:
+            p.submit(queue)
+        if ghosts is not None:
+            ghosts.submit(queue)
+        self.player.submit(queue)
+
+        # Shake only shifts what is drawn so far; the layers above it stay steady
+        queue.flush(surface, upto=LAYER_EFFECTS)
+        if self.screen_shake > 0:
+            shake_offset = fx_random.randint(-5, 5)
+            surface.blit(surface, (shake_offset, 0))
+        queue.flush(surface)
+
+        display_text(f"Coins: {self.player.coins_collected}", 30, 10, 10, surface=surface)
+        display_text(f"Distance: {int(self.player.distance_travelled)}", 30, 10, 40, surface=surface)
+        
+        if self.powerup_text and self.powerup_text_timer > 0:
+            text_surface = font.render(self.powerup_text, True, GREEN)
+            surface.blit(text_surface, (WIDTH//2 - text_surface.get_width()//2, HEIGHT - 50))
+
+    def snapshot(self):
+        """Capture the state as nested tuples of plain values.
+
+        The Mersenne Twister state is its own section so deltas can skip it
+        while it is unchanged.
+        """
+        rng_version, rng_internal, rng_gauss = self.rng.getstate()
+        scalars = (self.seed, self.ticks, self.base_speed, self.scroll_speed, self.spawn_timer,
+                   self.laser_timer, self.coin_line_timer, self.last_checkpoint,
+                   self.difficulty_level, self.screen_shake, self.powerup_text,
+                   self.powerup_text_timer, self.speed_multiplier, rng_version, rng_gauss)
+        return (
+            scalars,
+            self.player.get_state(),
+            self.background.get_state(),
+            tuple(o.get_state() for o in self.obstacles),
+            tuple(l.get_state() for l in self.lasers),
+            tuple(c.get_state() for c in self.coins),
+            tuple(p.get_state() for p in self.powerups),
+            tuple(b.get_state() for b in self.bullets),
+            tuple(e.get_state() for e in self.explosions),
+            rng_internal,
+        )
+
+    def restore(self, snapshot):
+        if len(snapshot) != 10 or len(snapshot[0]) != 15:
+            raise ValueError("snapshot layout does not match this version")
+        (scalars, player, background, obstacles, lasers, coins, powerups,
+         bullets, explosions, rng_internal) = snapshot
+        (self.seed, self.ticks, self.base_speed, self.scroll_speed, self.spawn_timer,
+         self.laser_timer, self.coin_line_timer, self.last_checkpoint,
+         self.difficulty_level, self.screen_shake, self.powerup_text,
+         self.powerup_text_timer, self.speed_multiplier, rng_version, rng_gauss) = scalars
+        self.player = Player.from_state(player)
+        self.background.set_state(background)
+        self.obstacles = [Obstacle.from_state(o) for o in obstacles]
+        self.lasers = [Laser.from_state(l) for l in lasers]
+        self.coins = [Coin.from_state(c) for c in coins]
+        self.powerups = [PowerUp.from_state(p) for p in powerups]
+        self.bullets = [Bullet.from_state(b) for b in bullets]
+        self.explosions = [Explosion.from_state(e) for e in explosions]
+        if rng_internal is not None:
+            self.rng.setstate((rng_version, tuple(rng_internal), rng_gauss))
+        self.death_cause = None
+        self.events = []
+        self.grid = None
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        state = cls.__new__(cls)
+        state.rng = random.Random()
+        state.background = Background()
+        state.restore(snapshot)
+        return state
+
+    def clone(self):
+        return GameState.from_snapshot(self.snapshot())
+
+# Every combination of one horizontal and one vertical key, index 4 is "stand still"
+AUTOPILOT_ACTIONS = tuple(
+    VirtualKeys({pygame.K_LEFT: dx < 0, pygame.K_RIGHT: dx > 0, pygame.K_UP: dy < 0, pygame.K_DOWN: dy > 0})
+    for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+)
+
+class Autopilot:
+    """Chooses the movement keys each tick with Monte Carlo rollouts.
+
+    Rollouts run on copies restored from a snapshot of the live state, so they
+    use exactly the same spawn, collision and pickup rules as the real run.
+    Each one holds a candidate action for hold_ticks, then holds random
+    actions until the horizon. Results decay rather than reset between ticks,
+    so every candidate keeps a useful estimate even when the budget only
+    covers a few rollouts per frame.
+    """
+    def __init__(self, budget_ms=8, horizon=2 * FPS, hold_ticks=12, decay=0.7, seed=None):
+        self.budget_ms = budget_ms
+        self.horizon = horizon
+        self.hold_ticks = hold_ticks
+        self.decay = decay
+        self.rng = random.Random(seed)
+        self.totals = [0.0] * len(AUTOPILOT_ACTIONS)
+        self.counts = [0.0] * len(AUTOPILOT_ACTIONS)
+        self.next_action = 0
+        # Stats from the last plan() call plus a running average of planning time
+        self.plan_ms = 0.0
+        self.average_plan_ms = 0.0
+        self.rollouts = 0
+        self.rollout_ticks = 0
+        self.total_ticks = 0
+        self.total_rollout_ticks = 0
+
+    def reset(self):
+        self.totals = [0.0] * len(AUTOPILOT_ACTIONS)
+        self.counts = [0.0] * len(AUTOPILOT_ACTIONS)
+
+    def plan(self, state):
+        """(keys, shoot) for the next tick of state, which is left untouched. Shoots whenever bullets are available."""
+        start = time.perf_counter()
+        deadline = start + self.budget_ms / 1000
+        base = state.snapshot()
+        self.totals = [total * self.decay for total in self.totals]
+        self.counts = [count * self.decay for count in self.counts]
+
+        rollouts = ticks = 0
+        # Always give every candidate at least one fresh rollout
+        while rollouts < len(AUTOPILOT_ACTIONS) or time.perf_counter() < deadline:
+            action = self.next_action
+            self.next_action = (action + 1) % len(AUTOPILOT_ACTIONS)
+            value, played = self.rollout(GameState.from_snapshot(base), action)
+            self.totals[action] += value
+            self.counts[action] += 1
+            rollouts += 1
+            ticks += played
+
+        best = max(range(len(AUTOPILOT_ACTIONS)), key=lambda i: self.totals[i] / self.counts[i])
+
+        self.plan_ms = (time.perf_counter() - start) * 1000
+        self.average_plan_ms += (self.plan_ms - self.average_plan_ms) * 0.05
+        self.rollouts = rollouts
+        self.rollout_ticks = ticks
+        self.total_ticks += 1
+        self.total_rollout_ticks += ticks
+        return AUTOPILOT_ACTIONS[best], state.player.can_shoot
+
+    def rollout(self, sim, action):
+        """Play sim forward from action. Returns (value, ticks simulated)."""
+        keys = AUTOPILOT_ACTIONS[action]
+        coins = sim.player.coins_collected
+        for tick in range(self.horizon):
+            if tick >= self.hold_ticks and tick % self.hold_ticks == 0:
+                keys = self.rng.choice(AUTOPILOT_ACTIONS)
+            if sim.player.can_shoot:
+                sim.shoot()
+            if sim.update(keys):
+                # Dying later is better than dying sooner
+                return -1000 * (self.horizon - tick) / self.horizon, tick + 1
+        player = sim.player
+        # Coins count toward the score, and staying low and central leaves room to dodge
+        value = (player.coins_collected - coins) * 20
+        value += 5 * player.rect.bottom / HEIGHT
+        value -= 5 * abs(player.rect.centerx - WIDTH / 2) / WIDTH
+        return value, self.horizon
+
+    def debug_lines(self):
+        per_ms = self.rollout_ticks / self.plan_ms if self.plan_ms else 0
+        return [
+            f"Autopilot: {self.plan_ms:.1f} ms/tick (avg {self.average_plan_ms:.1f})",
+            f"Rollouts: {self.rollouts}, {self.rollout_ticks} ticks ({per_ms:.0f}/ms)",
+        ]
+
+# Section delta tags, kept as plain ints so deltas survive pickling and JSON
+DELTA_FULL = 0
+DELTA_PATCH = 1
+
+GHOST_ESCAPE = -128  # dx byte that starts an absolute position in a ghost trace
+GHOST_ALPHA = 80
+
+def split_int16(value):
+    """High and low byte of a 16-bit value, both as signed bytes"""
+    return value >> 8, ((value & 0xFF) ^ 0x80) - 0x80
+
+class GhostRecorder:
+    """The player's position every tick, packed for ghost races.
+
+    Each tick is a (dx, dy) pair of signed bytes in an array('b'). The first
+    tick and any jump too big for a byte (rewinds, quick loads) are stored as
+    GHOST_ESCAPE followed by x and y as 16-bit values, high byte first.
+    """
+    def __init__(self):
+        self.data = array('b')
+        self.x = None
+        self.y = None
+        self.ticks = 0
+
+    def record(self, x, y):
+        if self.x is not None and -128 < x - self.x < 128 and -128 <= y - self.y < 128:
+            self.data.append(x - self.x)
+            self.data.append(y - self.y)
+        else:
+            self.data.append(GHOST_ESCAPE)
+            self.data.extend(split_int16(x))
+            self.data.extend(split_int16(y))
+        self.x = x
+        self.y = y
+        self.ticks += 1
+
+    def tobytes(self):
+        return self.data.tobytes()
+
+class GhostRace:
+    """Recorded runs replayed as translucent copies of the player.
+
+    Traces are decoded ahead into a ring of per-tick rows, each a flat
+    array('h') of every ghost's x and y for that tick, so a step is one ring
+    lookup and drawing hands the whole row to the render queue as one batch
+    of a shared frame. Each ghost decodes its next chunk_ticks on its own
+    staggered tick, which spreads the decoding evenly over the frames.
+    """
+    def __init__(self, traces, chunk_ticks=64):
+        self.chunk_ticks = chunk_ticks
+        self.image = self.ghost_frame()
+        self.ring = [array('h') for _ in range(2 * chunk_ticks)]
+        self.due = [[] for _ in range(chunk_ticks)]  # ghosts by the tick within a chunk they decode on
+        self.ghosts = len(traces)
+        self.tick = -1
+        self.row = array('h')
+        for i, trace in enumerate(traces):
+            data = array('b')
+            data.frombytes(trace)
+            ghost = [data, 0, 0, 0]  # trace, read position, x, y
+            stagger = i * chunk_ticks // len(traces)
+            if self.decode(ghost, 0, chunk_ticks + stagger):
+                self.due[stagger].append(ghost)
+
+    @staticmethod
+    def ghost_frame():
+        """The player's first frame, faded, shared by every ghost.
+
+        GIF transparency is all or nothing, so the frame becomes an RLE
+        colorkeyed surface with surface alpha, which SDL blits many times
+        faster than per-pixel alpha.
+        """
+        player = Player()
+        image = pygame.Surface(player.rect.size).convert()
+        if player.animation and player.animation.frames:
+            image.fill(MAGENTA)
+            image.blit(player.animation.frames[0], (0, 0))
+            image.set_colorkey(MAGENTA, pygame.RLEACCEL)
+        else:
+            image.fill(BLUE)
+        image.set_alpha(GHOST_ALPHA, pygame.RLEACCEL)
+        return image
+
+    def decode(self, ghost, start, count):
+        """Unpack count ticks of ghost into the ring from tick start. Returns False once its trace ends."""
+        data, pos, x, y = ghost
+        end = len(data)
+        ring = self.ring
+        size = len(ring)
+        for tick in range(start, start + count):
+            if pos >= end:
+                return False
+            dx = data[pos]
+            if dx == GHOST_ESCAPE:
+                x = data[pos + 1] << 8 | data[pos + 2] & 0xFF
+                y = data[pos + 3] << 8 | data[pos + 4] & 0xFF
+                pos += 5
+            else:
+                x += dx
+                y += data[pos + 1]
+                pos += 2
+            row = ring[tick % size]
+            row.append(x)
+            row.append(y)
+        ghost[1:] = pos, x, y
+        return True
+
+    def step(self):
+        """Move every ghost on to the next tick"""
+        self.tick += 1
+        slot = self.tick % len(self.ring)
+        self.row = self.ring[slot]
+        self.ring[slot] = array('h')
+        # The freed slot now holds tick + 2 * chunk_ticks, the end of this tick's decoding
+        due = self.tick % self.chunk_ticks
+        if self.due[due]:
+            start = self.tick + self.chunk_ticks
+            self.due[due] = [ghost for ghost in self.due[due] if self.decode(ghost, start, self.chunk_ticks)]
+
+    @property
+    def visible(self):
+        return len(self.row) // 2
+
+    def submit(self, queue):
+        # The player never leaves the screen, so neither do ghosts
+        positions = iter(self.row)
+        queue.extend(LAYER_GHOSTS, zip(repeat(self.image), zip(positions, positions)))
+
+def encode_delta(base, snapshot):
+    """Delta of a snapshot against an earlier one, section by section.
+
+    Unchanged sections become None, sections where less than half the items
+    changed become a list of (index, value) patches, anything else is stored whole.
+    """
+    delta = []
+    for old, new in zip(base, snapshot):
+        if old == new:
+            delta.append(None)
+            continue
+        if len(old) == len(new):
+            changes = [(i, value) for i, (prev, value) in enumerate(zip(old, new)) if prev != value]
+            if len(changes) * 2 < len(new):
+                delta.append((DELTA_PATCH, changes))
+                continue
+        delta.append((DELTA_FULL, new))
+    return tuple(delta)
+
+def apply_delta(base, delta):
+    sections = []
+    for section, change in zip(base, delta):
+        if change is None:
+            sections.append(section)
+        elif change[0] == DELTA_FULL:
+            sections.append(change[1])
+        else:
+            patched = list(section)
+            for i, value in change[1]:
+                patched[i] = value
+            sections.append(tuple(patched))
+    return tuple(sections)
+
+class RewindBuffer:
+    """Ring buffer of the last few seconds of snapshots.
+
+    Every keyframe_interval pushes a full snapshot is kept as a keyframe and
+    the frames in between are stored as deltas against it. Old frames fall off
+    the end of the deque, taking their keyframe with them once unreferenced.
+    """
+    def __init__(self, seconds=10, keyframe_interval=FPS):
+        self.frames = deque(maxlen=int(seconds * FPS))
+        self.keyframe_interval = keyframe_interval
+        self.keyframe = None
+        self.since_keyframe = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def push(self, snapshot):
+        if self.keyframe is None or self.since_keyframe >= self.keyframe_interval:
+            self.keyframe = snapshot
+            self.since_keyframe = 0
+            self.frames.append((snapshot, None))
+        else:
+            self.frames.append((self.keyframe, encode_delta(self.keyframe, snapshot)))
+        self.since_keyframe += 1
+
+    def rewind(self, frames=1):
+        """Drop the newest frames and return the snapshot `frames` ticks back"""
+        if not self.frames:
+            return None
+        for _ in range(min(frames, len(self.frames)) - 1):
+            self.frames.pop()
+        keyframe, delta = self.frames.pop()
+        # The next push starts a fresh keyframe rather than extending a popped one
+        self.keyframe = None
+        return keyframe if delta is None else apply_delta(keyframe, delta)
+
+    def clear(self):
+        self.frames.clear()
+        self.keyframe = None
+
+# Bump whenever the layout of GameState.snapshot() changes
+SNAPSHOT_VERSION = 3
+
+def save_snapshot(snapshot, path=QUICKSAVE_PATH):
+    try:
+        with open(path, 'wb') as f:
+            pickle.dump({'version': SNAPSHOT_VERSION, 'snapshot': snapshot}, f)
+        return True
+    except OSError as e:
+        print(f"Error saving snapshot {path}: {e}")
+        return False
+
+def load_snapshot(path=QUICKSAVE_PATH):
+    """Snapshot from a quick save, or None if it is missing, damaged or from another version.
+
+    The file is a pickle, so it must be trusted: loading one can run arbitrary code.
+    """
+    try:
+        with open(path, 'rb') as f:
+            saved = pickle.load(f)
+        if not isinstance(saved, dict) or saved.get('version') != SNAPSHOT_VERSION:
+            version = saved.get('version') if isinstance(saved, dict) else None
+            raise ValueError(f"unsupported save version {version!r}, expected {SNAPSHOT_VERSION}")
+        snapshot = saved['snapshot']
+        # Restore into a scratch state first, so a bad file never leaves the live run half restored
+        GameState.from_snapshot(snapshot)
+        return snapshot
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, KeyError) as e:
+        print(f"Error loading snapshot {path}: {e}")
+        return None
+
+class SpectatorServer:
+    """Streams per-tick game state to local spectators over TCP.
+
+    The server runs its own asyncio loop on a daemon thread. The game thread
+    only calls publish(), which hands over the snapshot and returns at once.
+    Each client has a sender coroutine that always sends the newest frame and
+    waits for its own socket to drain, so a slow viewer skips frames instead
+    of stalling the game or other viewers.
+
+    Messages are newline-delimited JSON: {"id": n, "base": m, "delta": [...]},
+    an encode_delta() of frame n against frame m, which is the last frame sent
+    to that client. A client's first message has base null and the full
+    snapshot in delta.
+    """
+    def __init__(self, host='127.0.0.1', port=8765, write_buffer_limit=256 * 1024):
+        self.host = host
+        self.port = port
+        self.write_buffer_limit = write_buffer_limit
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.running = False
+        self.ready = threading.Event()
+        self.clients = {}  # wake event -> (writer, sender task)
+        self.frame_id = 0
+        self.frame = None
+        self.encoded = {}
+
+    def start(self):
+        """Start serving in the background. Returns the bound port, or None on failure."""
+        self.thread = threading.Thread(target=self._run, name="spectator-server", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self.port if self.running else None
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._serve_client, self.host, self.port))
+        except OSError as e:
+            print(f"Error starting spectator server on {self.host}:{self.port}: {e}")
+            self.loop.close()
+            self.ready.set()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.running = True
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        future.result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+    async def _shutdown(self):
+        self.server.close()
+        tasks = []
+        for wake, (writer, task) in list(self.clients.items()):
+            # Aborting fails any pending drain; waking lets idle senders see running is False
+            writer.transport.abort()
+            wake.set()
+            tasks.append(task)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    @property
+    def client_count(self):
+        return len(self.clients)
+
+    def publish(self, snapshot):
+        """Thread-safe: queue a GameState snapshot for every connected client"""
+        if not self.running:
+            return
+        # Viewers only draw, so the RNG section is not worth sending
+        self.loop.call_soon_threadsafe(self._set_frame, snapshot[:-1] + (None,))
+
+    def _set_frame(self, frame):
+        self.frame_id += 1
+        self.frame = frame
+        self.encoded = {}
+        for wake in self.clients:
+            wake.set()
+
+    def _encode(self, base_id, base):
+        # Clients that are caught up share one encoded delta per frame
+        message = self.encoded.get(base_id)
+        if message is None:
+            delta = self.frame if base is None else encode_delta(base, self.frame)
+            payload = {'id': self.frame_id, 'base': base_id, 'delta': delta}
+            message = (json.dumps(payload, separators=(',', ':')) + '\n').encode()
+            self.encoded[base_id] = message
+        return message
+
+    async def _serve_client(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.write_buffer_limit)
+        # Left to autotune, the kernel buffers megabytes for a stalled viewer before drain() ever waits
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.write_buffer_limit)
+        wake = asyncio.Event()
+        if self.frame is not None:
+            wake.set()
+        self.clients[wake] = (writer, asyncio.current_task())
+        base_id, base = None, None
+        try:
+            while True:
+                await wake.wait()
+                wake.clear()
+                if not self.running:
+                    break
+                frame_id, frame = self.frame_id, self.frame
+                writer.write(self._encode(base_id, base))
+                # Only this client's coroutine waits here; newer frames coalesce meanwhile
+                await writer.drain()
+                base_id, base = frame_id, frame
+        except ConnectionError:
+            pass
+        finally:
+            del self.clients[wake]
+            writer.close()
+
+def function_qualnames():
+    """(filename, first line) -> qualified name for this module's functions and methods, e.g. 'Laser.draw'"""
+    names = {}
+    for obj in list(globals().values()):
+        if isinstance(obj, type) and obj.__module__ == __name__:
+            members = [(f"{obj.__name__}.{name}", value) for name, value in vars(obj).items()]
+        elif callable(obj) and getattr(obj, '__module__', None) == __name__:
+            members = [(obj.__name__, obj)]
+        else:
+            continue
+        for qualname, value in members:
+            if isinstance(value, (classmethod, staticmethod)):
+                value = value.__func__
+            elif isinstance(value, property):
+                value = value.fget
+            code = getattr(value, '__code__', None)
+            if code is not None:
+                names[(code.co_filename, code.co_firstlineno)] = qualname
+    return names
+
+class ProfileCapture:
+    """cProfile plus a timer signal that samples the game thread's stack.
+
+    stop() writes <prefix>.pstats for pstats/snakeviz and <prefix>.folded, one
+    collapsed stack per line, which flamegraph.pl, inferno and speedscope read
+    directly. Nothing is hooked into the game while no capture is running.
+    Sampling needs signal.setitimer, so on Windows only the .pstats is written.
+    Start and stop it from the main thread, where the game runs.
+    """
+    def __init__(self, interval_ms=1):
+        self.interval = interval_ms / 1000
+        self.profiler = cProfile.Profile()
+        self.qualnames = function_qualnames()
+        self.stacks = {}
+        self.sampling = hasattr(signal, 'setitimer')
+        self.previous_handler = None
+        self.last_sample = None
+        self.started = None
+
+    def start(self):
+        self.started = time.strftime("%Y%m%d-%H%M%S")
+        if self.sampling:
+            self.last_sample = time.perf_counter()
+            self.previous_handler = signal.signal(signal.SIGALRM, self._sample)
+            signal.setitimer(signal.ITIMER_REAL, self.interval, self.interval)
+        self.profiler.enable()
+
+    def _sample(self, signum, frame):
+        # The handler runs on the game thread between bytecodes, with frame being
+        # whatever it interrupted, so a sample that falls inside one C call (blits,
+        # scaling, clock.tick) is charged to its Python caller. Timer ticks during
+        # a long call are delivered once, so each sample counts the intervals since the last.
+        now = time.perf_counter()
+        weight = max(1, round((now - self.last_sample) / self.interval))
+        self.last_sample = now
+        stack = []
+        while frame is not None:
+            # A tick can also land while an earlier sample is still being taken
+            if frame.f_code is not ProfileCapture._sample.__code__:
+                stack.append(frame.f_code)
+            frame = frame.f_back
+        stack = tuple(reversed(stack))
+        self.stacks[stack] = self.stacks.get(stack, 0) + weight
+
+    def label(self, filename, lineno, name):
+        qualname = self.qualnames.get((filename, lineno))
+        if qualname is not None:
+            return qualname
+        return f"{os.path.basename(filename)}:{name}"
+
+    def stop(self):
+        """Stop capturing and write the files. Returns the path prefix, or None on error."""
+        self.profiler.disable()
+        if self.sampling:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.previous_handler)
+
+        self.profiler.create_stats()
+        renamed = {}
+        for (filename, lineno, name), (cc, nc, tt, ct, callers) in self.profiler.stats.items():
+            callers = {(f, l, self.qualnames.get((f, l), n)): value for (f, l, n), value in callers.items()}
+            renamed[(filename, lineno, self.qualnames.get((filename, lineno), name))] = (cc, nc, tt, ct, callers)
+
+        prefix = os.path.join(PROFILE_DIR, f"roborun-{self.started}")
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(prefix + ".pstats", 'wb') as f:
+                marshal.dump(renamed, f)
+            if self.sampling:
+                with open(prefix + ".folded", 'w') as f:
+                    for stack, count in self.stacks.items():
+                        labels = (self.label(code.co_filename, code.co_firstlineno, code.co_name) for code in stack)
+                        f.write(f"{';'.join(labels)} {count}\n")
+        except OSError as e:
+            print(f"Error saving profile {prefix}: {e}")
+            return None
+        return prefix
+
+profile_capture = None
+
+def toggle_profile_capture():
+    """Start a capture, or stop and save the running one"""
+    global profile_capture
+    if profile_capture is None:
+        profile_capture = ProfileCapture()
+        profile_capture.start()
+        print("Profiling started")
+    else:
+        stop_profile_capture()
+
+def stop_profile_capture():
+    global profile_capture
+    if profile_capture is None:
+        return
+    capture, profile_capture = profile_capture, None
+    prefix = capture.stop()
+    if prefix is not None:
+        folded = f" and {prefix}.folded" if capture.sampling else ""
+        print(f"Profile saved to {prefix}.pstats{folded}")
+
+PRACTICE_REWIND_SECONDS = 2
+
+def queue_prefetch():
+    """Build frames and sprites that would otherwise be made on first use in the middle of a run"""
+    frame_scheduler.defer("prefetch drone", Obstacle, 0, 0, 'drone')
+    for p_type in ('invincibility', 'magnet', 'bullet'):
+        frame_scheduler.defer("prefetch powerup", lambda p_type=p_type: PowerUp(0, 0, p_type).get_body_sprite())
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RoboRun desktop edition")
+    parser.add_argument('--practice', action='store_true',
+                        help="practice mode: hold Backspace to rewind, deaths rewind instead of ending the run")
+    parser.add_argument('--resume', action='store_true',
+                        help="resume the first run from the quick save (F5 saves, F9 loads)")
+    parser.add_argument('--seed', type=int, default=None, help="gameplay RNG seed")
+    parser.add_argument('--spectate', type=int, default=None, metavar='PORT',
+                        help="stream live runs to spectator.py clients on this port")
+    parser.add_argument('--spectate-host', default='127.0.0.1',
+                        help="interface for the spectator server (default: localhost only)")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="scale each frame on a worker thread while the next one is simulated")
+    parser.add_argument('--autopilot', action='store_true',
+                        help="let the autopilot play (F6 toggles it during a run)")
+    parser.add_argument('--autopilot-budget', type=float, default=8, metavar='MS',
+                        help="planning time the autopilot may spend per tick")
+    parser.add_argument('--ghosts', type=int, default=0, metavar='N',
+                        help="race the ghosts of the N best recorded runs (only runs with --seed, if given)")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile the whole session into profiles/ (F8 starts and stops a capture)")
+    return parser.parse_args(argv)
+
+def game_loop(options=None):
+    if options is None:
+        options = parse_args([])
     show_start_screen = True
+    resume = options.resume
+    if options.pipelined:
+        enable_render_pipeline()
+    if options.profile:
+        toggle_profile_capture()
+    if run_store is None:
+        open_run_store()
+    # Assets and module state are loaded; keep full collections from walking them again
+    frame_scheduler.install()
+    frame_scheduler.freeze()
+    frame_scheduler.every("flush log", 0.5, flush_log)
+    frame_scheduler.every("trim sprites", 5, trim_sprite_cache)
+    queue_prefetch()
+    spectator_server = None
+    if options.spectate is not None:
+        spectator_server = SpectatorServer(options.spectate_host, options.spectate)
+        port = spectator_server.start()
+        if port is not None:
+            print(f"Spectator server listening on {options.spectate_host}:{port}")
     
     while True:
         # Show start screen only on first run or when returning from game over
@@ -773,76 +2868,73 @@ def game_loop():
             start_screen()
             show_start_screen = False
         
-        player = Player()
-        obstacles = []
-        lasers = []
-        coins = []
-        powerups = []
-        bullets = []
-        explosions = []
-        base_speed = 5  # Initial base speed
-        scroll_speed = base_speed
-        spawn_timer = 0
-        laser_timer = 0
-        coin_line_timer = 0
+        state = GameState(options.seed)
+        if resume:
+            resume = False
+            snapshot = load_snapshot()
+            if snapshot is not None:
+                state.restore(snapshot)
+        rewind_buffer = RewindBuffer() if options.practice else None
+        autopilot = Autopilot(options.autopilot_budget) if options.autopilot else None
+        ghost_recorder = GhostRecorder()
+        ghost_race = None
+        if options.ghosts > 0 and run_store is not None:
+            traces = run_store.ghost_traces(options.ghosts, options.seed)
+            if traces:
+                ghost_race = GhostRace(traces)
         running = True
         paused = False
-        last_checkpoint = 0
-        difficulty_level = 1
-        background = Background()
-        screen_shake = 0
-        powerup_text = None
-        powerup_text_timer = 0
-        game_start_time = pygame.time.get_ticks()
-        speed_multiplier = 1.0  # Base speed multiplier
+        show_debug = False
+        frame_scheduler.enter_gameplay()
 
         while running:
+            # Deferred work goes in the slack between the last frame and the next tick
+            frame_scheduler.end_frame()
             clock.tick(FPS)
+            frame_scheduler.begin_frame()
+            if not paused:
+                quality_governor.update(clock.get_rawtime())
             virtual_surface.fill(BLACK)
-            
-            # Calculate time-based speed scaling
-            current_time = pygame.time.get_ticks()
-            time_elapsed = (current_time - game_start_time) / 1000.0  # Convert to seconds
-            speed_scale = 1.0 + (time_elapsed * 0.01)  # Increase speed by 1% every second
-            current_speed = base_speed * speed_scale * speed_multiplier
-            
-            # Update scroll speed based on current game speed
-            scroll_speed = current_speed
-            player.speed = current_speed  # Player speed matches game speed
-            
-            background.update(scroll_speed, player.distance_travelled)
-            background.draw(virtual_surface, player.distance_travelled)
             keys = pygame.key.get_pressed()
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    quit_game()
                 elif event.type == pygame.VIDEORESIZE:
                     # Handle window resizing for responsive design
-                    global SCREEN_WIDTH, SCREEN_HEIGHT, SCALE, WINDOW_WIDTH, WINDOW_HEIGHT, LETTERBOX_X, LETTERBOX_Y
-                    SCREEN_WIDTH = event.w
-                    SCREEN_HEIGHT = event.h
-                    SCALE_X = SCREEN_WIDTH / BASE_WIDTH
-                    SCALE_Y = SCREEN_HEIGHT / BASE_HEIGHT
-                    SCALE = min(SCALE_X, SCALE_Y)
-                    WINDOW_WIDTH = int(BASE_WIDTH * SCALE)
-                    WINDOW_HEIGHT = int(BASE_HEIGHT * SCALE)
-                    LETTERBOX_X = (SCREEN_WIDTH - WINDOW_WIDTH) // 2
-                    LETTERBOX_Y = (SCREEN_HEIGHT - WINDOW_HEIGHT) // 2
-                    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
+                    request_resize(event.w, event.h)
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         paused = not paused
+                        if paused:
+                            frame_scheduler.leave_gameplay()
+                        else:
+                            frame_scheduler.enter_gameplay()
+                    elif event.key == pygame.K_F3:
+                        show_debug = not show_debug
+                    elif event.key == pygame.K_F8:
+                        toggle_profile_capture()
+                    elif event.key == pygame.K_F6:
+                        autopilot = None if autopilot else Autopilot(options.autopilot_budget)
+                    elif event.key == pygame.K_F5:
+                        if save_snapshot(state.snapshot()):
+                            state.powerup_text = "Game Saved"
+                            state.powerup_text_timer = 60
+                    elif event.key == pygame.K_F9:
+                        snapshot = load_snapshot()
+                        if snapshot is not None:
+                            state.restore(snapshot)
+                            if rewind_buffer:
+                                rewind_buffer.clear()
+                            if autopilot:
+                                autopilot.reset()
                     elif event.key == pygame.K_q and paused:
-                        pygame.quit()
-                        sys.exit()
+                        quit_game()
                     elif event.key == pygame.K_SPACE and not paused:
-                        bullet = player.shoot()
-                        if bullet:
-                            bullets.append(bullet)
+                        state.shoot()
 
             if paused:
+                state.draw(virtual_surface, ghost_race)
                 # Draw pause overlay
                 overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
                 overlay.fill((0, 0, 0, 128))
@@ -854,180 +2946,99 @@ def game_loop():
                 virtual_surface.blit(pause_text, (WIDTH//2 - pause_text.get_width()//2, HEIGHT//2 - 30))
                 virtual_surface.blit(resume_text, (WIDTH//2 - resume_text.get_width()//2, HEIGHT//2 + 20))
                 virtual_surface.blit(quit_text, (WIDTH//2 - quit_text.get_width()//2, HEIGHT//2 + 50))
-                render_to_screen()
-                pygame.display.flip()
+                present_frame()
                 continue
 
-            player.move(keys)
-
-            spawn_timer += 1
-            laser_timer += 1
-            coin_line_timer += 1
-
-            if int(player.distance_travelled) % CHECKPOINT_DISTANCE == 0 and int(player.distance_travelled) > last_checkpoint:
-                last_checkpoint = int(player.distance_travelled)
-                difficulty_level += 1
-                p_type = random.choice(['invincibility', 'magnet', 'bullet'])
-                px, py = find_safe_spawn_position(30, 30, obstacles + lasers + powerups + coins)
-                if px is not None:
-                    powerups.append(PowerUp(px, py, p_type))
-                checkpoint_message = font.render(f"Checkpoint Reached! Level: {difficulty_level}", True, GREEN)
-                virtual_surface.blit(checkpoint_message, (WIDTH//2 - checkpoint_message.get_width()//2, HEIGHT//2))
-                render_to_screen()
-                pygame.display.flip()
-                pygame.time.wait(1000)
-
-            expired_text = player.update_powerup()
-            if expired_text:
-                powerup_text = expired_text
-                powerup_text_timer = 60
-                if "Invincibility" in expired_text:
-                    speed_multiplier = 1.0  # Reset speed multiplier when invincibility expires
-                elif "Magnet" in expired_text:
-                    player.magnet = False
-                elif "Bullet" in expired_text:
-                    player.can_shoot = False
-
-            if spawn_timer > 60:
-                spawn_timer = 0
-                x, y = find_safe_spawn_position(144, 144, obstacles + lasers + powerups + coins)
-                if x is not None:
-                    new_obstacle = Obstacle(x, y, 'drone')
-                    obstacles.append(new_obstacle)
-                    if not ensure_safe_path(obstacles + lasers):
-                        obstacles.pop()
-
-                if random.random() < 0.1:
-                    p_type = random.choice(['invincibility', 'magnet', 'bullet'])
-                    px, py = find_safe_spawn_position(30, 30, obstacles + lasers + powerups + coins)
-                    if px is not None:
-                        powerups.append(PowerUp(px, py, p_type))
-
-            # Update and draw bullets
-            for bullet in bullets[:]:
-                bullet.update()
-                bullet.draw(virtual_surface)
-                
-                # Check for bullet collisions with obstacles
-                for obstacle in obstacles[:]:
-                    if bullet.rect.colliderect(obstacle.hitbox):
-                        explosions.append(Explosion(obstacle.rect.centerx, obstacle.rect.centery))
-                        obstacles.remove(obstacle)
-                        bullets.remove(bullet)
-                        break
-                
-                # Remove bullets that are off screen
-                if bullet.y < -bullet.radius:
-                    bullets.remove(bullet)
-
-            # Update and draw explosions
-            for explosion in explosions[:]:
-                explosion.update()
-                explosion.draw(virtual_surface)
-                if explosion.particles[0]['life'] <= 0:
-                    explosions.remove(explosion)
-
-            if laser_timer > 180:
-                laser_timer = 0
-                for _ in range(5):
-                    x1 = random.randint(50, WIDTH - 50)
-                    x2 = random.randint(50, WIDTH - 50)
-                    y1 = -20
-                    y2 = y1 - random.randint(60, HEIGHT//2)
-                    new_laser = Laser(x1, y1, x2, y2)
-                    if not check_overlap(new_laser.hitbox, obstacles + lasers + powerups + coins, buffer=30):
-                        if ensure_safe_path(obstacles + lasers + [new_laser]):
-                            lasers.append(new_laser)
-                            break
-
-            if coin_line_timer > 90:
-                coin_line_timer = 0
-                base_x = random.randint(100, WIDTH - 100)
-                spawn_coin_line(base_x, obstacles, lasers, powerups, coins)
-
-            player.distance_travelled += scroll_speed / FPS
-
-            if screen_shake > 0:
-                screen_shake -= 1
-                shake_offset = random.randint(-5, 5)
-                virtual_surface.blit(virtual_surface, (shake_offset, 0))
-
-            for obs in obstacles:
-                obs.update(scroll_speed)
-                obs.draw(virtual_surface)
-                if obs.hitbox.colliderect(player.get_hitbox()) and not player.invincible:
-                    print("Enemy collision detected!")
-                    player.hit_timer = 30
-                    screen_shake = 10
-                    score = int(player.distance_travelled * player.coins_collected)
-                    result = game_over_menu(score)
-                    if result == "restart":
-                        running = False
-                        break
-                    else:
-                        running = False
-                        break
-
-            for laser in lasers:
-                laser.update(scroll_speed)
-                laser.draw(virtual_surface)
-                if laser.collides_with(player.get_hitbox()) and not player.invincible:
-                    print("Laser collision detected!")
-                    player.hit_timer = 30
-                    screen_shake = 10
-                    score = int(player.distance_travelled * player.coins_collected)
-                    result = game_over_menu(score)
-                    if result == "restart":
-                        running = False
-                        break
-                    else:
-                        running = False
-                        break
-
-            for coin in coins:
-                coin.update(scroll_speed)
-                if not coin.collected and coin.rect.colliderect(player.get_hitbox()):
-                    print("Coin collected!")
-                    coin.collected = True
-                    player.coins_collected += 1
-                if player.magnet and not coin.collected:
-                    if abs(coin.x - player.rect.centerx) < 100:
-                        coin.x += (player.rect.centerx - coin.x) // 5
-                        coin.y += (player.rect.centery - coin.y) // 5
-                        coin.rect.x = coin.x - COIN_RADIUS
-                        coin.rect.y = coin.y - COIN_RADIUS
-                coin.draw(virtual_surface)
-
-            for p in powerups[:]:
-                p.update(scroll_speed)
-                p.draw(virtual_surface)
-                if p.rect.colliderect(player.get_hitbox()):
-                    print("Powerup collected!")
-                    if p.type == 'invincibility':
-                        player.invincible = True
-                        speed_multiplier = 3.0  # Triple the overall game speed
-                        powerup_text = "Invincibility Activated!"
-                    elif p.type == 'magnet':
-                        player.magnet = True
-                        powerup_text = "Magnet Power Activated!"
-                    elif p.type == 'bullet':
-                        player.can_shoot = True
-                        powerup_text = "Bullet Power Activated!"
-                    player.powerup_timer = pygame.time.get_ticks()
-                    powerup_text_timer = 60
-                    powerups.remove(p)
-
-            player.draw(virtual_surface)
-
-            display_text(f"Coins: {player.coins_collected}", 30, 10, 10)
-            display_text(f"Distance: {int(player.distance_travelled)}", 30, 10, 40)
-            
-            if powerup_text and powerup_text_timer > 0:
-                powerup_text_timer -= 1
-                text_surface = font.render(powerup_text, True, GREEN)
-                virtual_surface.blit(text_surface, (WIDTH//2 - text_surface.get_width()//2, HEIGHT - 50))
-
-            render_to_screen()
-            pygame.display.flip()
+            if rewind_buffer is not None and keys[pygame.K_BACKSPACE]:
+                # Rewind at double speed while Backspace is held
+                snapshot = rewind_buffer.rewind(2)
+                if snapshot is not None:
+                    state.restore(snapshot)
+                state.draw(virtual_surface, ghost_race)
+                display_text("<< REWIND", 30, WIDTH - 180, 10)
+                present_frame()
+                continue
 
-game_loop()
\ No newline at end of file
+            if autopilot is not None:
+                keys, shoot = autopilot.plan(state)
+                if shoot:
+                    state.shoot()
+            death_cause = state.update(keys)
+            ghost_recorder.record(*state.player.rect.topleft)
+            if ghost_race is not None:
+                ghost_race.step()
+            if rewind_buffer is not None or spectator_server is not None:
+                snapshot = state.snapshot()
+                if rewind_buffer is not None and death_cause is None:
+                    rewind_buffer.push(snapshot)
+                if spectator_server is not None:
+                    spectator_server.publish(snapshot)
+            state.draw(virtual_surface, ghost_race)
+
+            checkpoint_pause = False
+            for event_name in state.events:
+                if event_name == 'coin':
+                    log("Coin collected!")
+                elif event_name == 'powerup':
+                    log("Powerup collected!")
+                elif event_name == 'drone_collision':
+                    log("Enemy collision detected!")
+                elif event_name == 'laser_collision':
+                    log("Laser collision detected!")
+                elif event_name == 'checkpoint':
+                    checkpoint_message = font.render(f"Checkpoint Reached! Level: {state.difficulty_level}", True, GREEN)
+                    virtual_surface.blit(checkpoint_message, (WIDTH//2 - checkpoint_message.get_width()//2, HEIGHT//2))
+                    checkpoint_pause = True
+
+            if death_cause:
+                snapshot = None
+                if rewind_buffer is not None:
+                    snapshot = rewind_buffer.rewind(PRACTICE_REWIND_SECONDS * FPS)
+                if snapshot is not None:
+                    state.restore(snapshot)
+                    state.powerup_text = "Rewound - try again!"
+                    state.powerup_text_timer = 60
+                else:
+                    score = int(state.player.distance_travelled * state.player.coins_collected)
+                    if run_store is not None:
+                        source = 'autopilot' if autopilot is not None else ('practice' if options.practice else 'player')
+                        run_store.record(score, state.player.distance_travelled, state.player.coins_collected,
+                                         state.difficulty_level, state.seed, death_cause, source,
+                                         trace=ghost_recorder.tobytes())
+                    if autopilot is not None and autopilot.total_ticks:
+                        print(f"Autopilot: {state.ticks} ticks, score {score}, "
+                              f"{autopilot.average_plan_ms:.1f} ms planning and "
+                              f"{autopilot.total_rollout_ticks // autopilot.total_ticks} rollout ticks per tick")
+                    frame_scheduler.leave_gameplay()
+                    game_over_menu(score)
+                    running = False
+                    continue
+
+            if show_debug:
+                debug_lines = []
+                if spectator_server is not None:
+                    debug_lines.append(f"Spectators: {spectator_server.client_count}")
+                if render_pipeline is not None:
+                    debug_lines.append(f"Scale: {render_pipeline.present_ms:.1f} ms (waited {render_pipeline.wait_ms:.1f} ms)")
+                if ghost_race is not None:
+                    debug_lines.append(f"Ghosts: {ghost_race.visible} of {ghost_race.ghosts}")
+                debug_lines.append(f"Draw: {render_queue.sprites} sprites in {render_queue.batches} batches, "
+                                   f"{render_queue.calls} calls, {render_queue.culled} culled")
+                if autopilot is not None:
+                    debug_lines.extend(autopilot.debug_lines())
+                debug_lines.extend(frame_scheduler.debug_lines())
+                draw_debug_overlay(extra_lines=debug_lines)
+
+            present_frame(hold=checkpoint_pause)
+            if checkpoint_pause:
+                # The game stands still for a second anyway, so deferred work gets it first
+                pause_start = pygame.time.get_ticks()
+                frame_scheduler.run_deferred(1000)
+                pygame.time.wait(max(0, 1000 - (pygame.time.get_ticks() - pause_start)))
+
+if __name__ == "__main__":
+    try:
+        game_loop(parse_args())
+    finally:
+        # Keep the capture from a session that crashed
+        stop_profile_capture()
@@ -0,0 +1,276 @@
+"""Persistent run history and leaderboard for the desktop build.
+
+Every finished run is a row in an SQLite database (WAL mode, so the start
+screen can read while runs are being written). Rows are queued by the game
+and written in batches on a background thread. Top-K queries go through an
+index on score. Percentiles use a log-bucketed score histogram to find the
+right stretch of that index, so they stay fast with millions of runs. Runs
+played in the game also keep their ghost trace (the player's position every
+tick, as packed by main.GhostRecorder) for ghost races.
+
+    python runstore.py stats
+    python runstore.py top --count 20
+    python runstore.py import simulated_runs.csv --source sim
+"""
+import argparse
+import csv
+import math
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+# Histogram resolution: buckets per doubling of the score
+BUCKETS_PER_DOUBLING = 16
+
+RUN_FIELDS = ('score', 'distance', 'coins', 'level', 'seed', 'death_cause', 'source', 'created_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    distance REAL NOT NULL,
+    coins INTEGER NOT NULL,
+    level INTEGER NOT NULL,
+    seed INTEGER,
+    death_cause TEXT,
+    source TEXT NOT NULL DEFAULT 'player',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_score ON runs (score);
+CREATE TABLE IF NOT EXISTS score_buckets (
+    bucket INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL,
+    min_score INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    runs INTEGER NOT NULL,
+    distance REAL NOT NULL,
+    coins INTEGER NOT NULL,
+    best_score INTEGER NOT NULL,
+    best_distance REAL NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (1, 0, 0, 0, 0, 0);
+CREATE TABLE IF NOT EXISTS ghosts (
+    run_id INTEGER PRIMARY KEY REFERENCES runs (id),
+    trace BLOB NOT NULL
+);
+"""
+
+
+def score_bucket(score):
+    """Histogram bucket of a score; buckets only grow with the score"""
+    if score <= 0:
+        return 0
+    return 1 + int(math.log2(score) * BUCKETS_PER_DOUBLING)
+
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+INSERT_RUN = f"INSERT INTO runs ({', '.join(RUN_FIELDS)}) VALUES ({', '.join('?' * len(RUN_FIELDS))})"
+
+def write_runs(conn, rows, traces=None):
+    """Insert rows (tuples in RUN_FIELDS order) and update the histogram and totals in one transaction.
+
+    traces, if given, lines up with rows: each run's ghost trace (bytes) or None.
+    """
+    if not rows:
+        return
+    buckets = {}
+    distance = coins = 0
+    best_score = best_distance = 0
+    for row in rows:
+        score = row[0]
+        bucket = score_bucket(score)
+        count, min_score = buckets.get(bucket, (0, score))
+        buckets[bucket] = (count + 1, min(min_score, score))
+        distance += row[1]
+        coins += row[2]
+        best_score = max(best_score, score)
+        best_distance = max(best_distance, row[1])
+    with conn:
+        if traces and any(traces):
+            # Ghosts need each run's id, so these go in one at a time
+            for row, trace in zip(rows, traces):
+                run_id = conn.execute(INSERT_RUN, row).lastrowid
+                if trace:
+                    conn.execute("INSERT INTO ghosts VALUES (?, ?)", (run_id, trace))
+        else:
+            conn.executemany(INSERT_RUN, rows)
+        conn.executemany(
+            "INSERT INTO score_buckets VALUES (?, ?, ?) ON CONFLICT (bucket) DO UPDATE SET "
+            "count = count + excluded.count, min_score = min(min_score, excluded.min_score)",
+            [(bucket, count, min_score) for bucket, (count, min_score) in buckets.items()])
+        conn.execute(
+            "UPDATE totals SET runs = runs + ?, distance = distance + ?, coins = coins + ?, "
+            "best_score = max(best_score, ?), best_distance = max(best_distance, ?) WHERE id = 1",
+            (len(rows), distance, coins, best_score, best_distance))
+
+
+class RunStore:
+    """Run history backed by SQLite.
+
+    record() only queues the run; a writer thread with its own connection
+    commits queued runs together, at most batch_seconds after they arrive.
+    Queries run on the calling thread's connection and never wait for it.
+    """
+    def __init__(self, path, batch_seconds=0.5, batch_size=1000):
+        self.path = path
+        self.batch_seconds = batch_seconds
+        self.batch_size = batch_size
+        self.conn = connect(path)
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, score, distance, coins, level, seed=None, death_cause=None, source='player', created_at=None,
+               trace=None):
+        if created_at is None:
+            created_at = time.time()
+        row = (int(score), float(distance), int(coins), int(level), seed, death_cause, source, created_at)
+        self.pending.put((row, trace))
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        running = True
+        while running:
+            batch = []
+            traces = []
+            item = self.pending.get()
+            deadline = time.monotonic() + self.batch_seconds
+            while item is not None:
+                batch.append(item[0])
+                traces.append(item[1])
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.pending.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if item is None:
+                running = False
+            try:
+                write_runs(conn, batch, traces)
+            except sqlite3.Error as e:
+                print(f"Error recording {len(batch)} runs: {e}")
+            for _ in range(len(batch) + (not running)):
+                self.pending.task_done()
+        conn.close()
+
+    def flush(self):
+        """Block until every recorded run is committed"""
+        self.pending.join()
+
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+        self.conn.close()
+
+    def import_rows(self, rows, source='import'):
+        """Write runs straight from dicts keyed by RUN_FIELDS, bypassing the queue. Returns the count."""
+        count = 0
+        batch = []
+        now = time.time()
+        for row in rows:
+            batch.append((int(float(row['score'])), float(row['distance']), int(row['coins']),
+                          int(row.get('level') or 1), int(row['seed']) if row.get('seed') else None,
+                          row.get('death_cause') or None, row.get('source') or source,
+                          float(row.get('created_at') or now)))
+            if len(batch) >= self.batch_size * 50:
+                write_runs(self.conn, batch)
+                count += len(batch)
+                batch = []
+        write_runs(self.conn, batch)
+        return count + len(batch)
+
+    def top_scores(self, count=5):
+        """Best runs as dicts, highest score first"""
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(RUN_FIELDS)} FROM runs ORDER BY score DESC, id LIMIT ?", (count,))
+        return [dict(zip(RUN_FIELDS, row)) for row in cursor]
+
+    def ghost_traces(self, count, seed=None):
+        """Ghost traces of the best runs that have one, optionally only runs with this seed"""
+        where = "" if seed is None else "WHERE runs.seed = ? "
+        cursor = self.conn.execute(
+            f"SELECT trace FROM ghosts JOIN runs ON runs.id = ghosts.run_id {where}"
+            "ORDER BY runs.score DESC, runs.id LIMIT ?", (count,) if seed is None else (seed, count))
+        return [row[0] for row in cursor]
+
+    def totals(self):
+        row = self.conn.execute(
+            "SELECT runs, distance, coins, best_score, best_distance FROM totals WHERE id = 1").fetchone()
+        return dict(zip(('runs', 'distance', 'coins', 'best_score', 'best_distance'), row))
+
+    @property
+    def best_score(self):
+        return self.totals()['best_score']
+
+    def percentile(self, percent):
+        """Score at the given percentile (nearest rank), or None with no runs"""
+        total = self.totals()['runs']
+        if total == 0:
+            return None
+        rank = min(total - 1, int(total * percent / 100))
+        below = 0
+        for count, min_score in self.conn.execute("SELECT count, min_score FROM score_buckets ORDER BY bucket"):
+            if below + count > rank:
+                # Every lower score is in an earlier bucket, so only this bucket's stretch of the index is walked
+                row = self.conn.execute("SELECT score FROM runs WHERE score >= ? ORDER BY score LIMIT 1 OFFSET ?",
+                                        (min_score, rank - below)).fetchone()
+                return row[0]
+            below += count
+        return None
+
+    def summary(self):
+        """Totals plus median and 90th percentile, as shown on the start screen"""
+        summary = self.totals()
+        summary['median'] = self.percentile(50)
+        summary['p90'] = self.percentile(90)
+        return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Query or fill the RoboRun run history")
+    parser.add_argument('--db', default='runs.db', help="database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="totals and score percentiles")
+    top = commands.add_parser('top', help="best runs")
+    top.add_argument('--count', type=int, default=10)
+    imports = commands.add_parser('import', help="import runs from a CSV file with a header row")
+    imports.add_argument('csv_path')
+    imports.add_argument('--source', default='import', help="source for rows without one")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    options = parse_args(argv)
+    store = RunStore(options.db)
+    try:
+        if options.command == 'import':
+            start = time.perf_counter()
+            with open(options.csv_path, newline='') as f:
+                count = store.import_rows(csv.DictReader(f), options.source)
+            print(f"Imported {count} runs in {time.perf_counter() - start:.1f} s")
+        elif options.command == 'top':
+            for i, run in enumerate(store.top_scores(options.count), 1):
+                print(f"{i:3}. {run['score']:>10}  distance {run['distance']:.0f}, coins {run['coins']}, "
+                      f"level {run['level']}, {run['death_cause'] or '-'} ({run['source']})")
+        else:
+            summary = store.summary()
+            print(f"Runs: {summary['runs']}, coins: {summary['coins']}, distance: {summary['distance']:.0f}")
+            print(f"Best score: {summary['best_score']}, best distance: {summary['best_distance']:.0f}")
+            for percent in (50, 90, 99):
+                print(f"p{percent}: {store.percentile(percent)}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
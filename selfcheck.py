@@ -0,0 +1,363 @@
+"""Self-checks for the parts of RoboRun that are easy to break quietly.
+
+Runs headless through the dummy SDL driver and exits with status 1 if any
+check fails. Every check is seeded, so a failure reproduces with the same
+--seed.
+
+    python selfcheck.py
+    python selfcheck.py --only delta spectator --seed 3
+"""
+import os
+
+# Checks never need a real window or audio device
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import random
+import socket
+import struct
+import sys
+import time
+
+import pygame
+
+import main
+import spectator
+
+
+def played_snapshots(seed, ticks):
+    """One snapshot per tick of a run with random held inputs and shooting, collisions ignored"""
+    rng = random.Random(seed)
+    state = main.GameState(seed)
+    state.player.can_shoot = True
+    keys = main.VirtualKeys()
+    snapshots = []
+    for tick in range(ticks):
+        if tick % 20 == 0:
+            keys = main.VirtualKeys({
+                key: rng.random() < 0.3
+                for key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN)
+            })
+            state.shoot()
+        if state.update(keys):
+            state.death_cause = None
+        snapshots.append(state.snapshot())
+    return snapshots
+
+def wire(value):
+    """value as a spectator sees it after the JSON round trip"""
+    return json.loads(json.dumps(value))
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def check_delta(rng):
+    """apply_delta(base, encode_delta(base, s)) == s, directly and through JSON"""
+    snapshots = played_snapshots(rng.randrange(2**32), 1200)
+    failures = []
+    for gap in (1, 2, 15, 60, 600):
+        for i in range(gap, len(snapshots)):
+            base, snapshot = snapshots[i - gap], snapshots[i]
+            if main.apply_delta(base, main.encode_delta(base, snapshot)) != snapshot:
+                failures.append(f"tick {i} against tick {i - gap}")
+    for i in range(1, len(snapshots)):
+        base, snapshot = snapshots[i - 1], snapshots[i]
+        delta = wire(main.encode_delta(base, snapshot))
+        if wire(main.apply_delta(wire(base), delta)) != wire(snapshot):
+            failures.append(f"tick {i} through JSON")
+    return failures
+
+def check_spectator(rng):
+    """Spectator stream over localhost: a slow viewer is coalesced onto the newest
+    frame without holding up publish() or other viewers, and a viewer that drops
+    mid-stream is cleaned up."""
+    snapshots = played_snapshots(rng.randrange(2**32), 900)
+    server = main.SpectatorServer(port=0, write_buffer_limit=16 * 1024)
+    port = server.start()
+    if port is None:
+        return ["spectator server did not start"]
+    failures = []
+    sockets = []
+    try:
+        viewer = spectator.SpectatorClient(port=port)
+        viewer.start()
+        # A small receive buffer set before connecting stops the kernel from soaking up the whole run
+        slow = socket.socket()
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        slow.settimeout(5)
+        slow.connect(('127.0.0.1', port))
+        dropped = socket.create_connection(('127.0.0.1', port))
+        sockets = [viewer, slow, dropped]
+        if not wait_for(lambda: server.client_count == 3):
+            return [f"{server.client_count} of 3 viewers connected"]
+
+        worst_ms = 0.0
+        for i, snapshot in enumerate(snapshots):
+            start = time.perf_counter()
+            server.publish(snapshot)
+            worst_ms = max(worst_ms, (time.perf_counter() - start) * 1000)
+            if i == len(snapshots) // 3:
+                # A reset rather than a clean close, like a viewer that crashed
+                dropped.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                dropped.close()
+            time.sleep(0.002)
+        if worst_ms > 50:
+            failures.append(f"publish() blocked for {worst_ms:.1f} ms")
+        if not wait_for(lambda: server.client_count == 2):
+            failures.append(f"dropped viewer not cleaned up, {server.client_count} clients")
+
+        newest = wire(snapshots[-1][:-1] + (None,))
+        if not wait_for(lambda: viewer.frame_id == server.frame_id):
+            failures.append(f"viewer stuck at frame {viewer.frame_id} of {server.frame_id}")
+        elif wire(viewer.latest()) != newest:
+            failures.append("viewer's newest frame differs from the published snapshot")
+
+        # The slow viewer only reads now, after every frame is out
+        stream = slow.makefile('rb')
+        frame_id, snapshot, received = None, None, 0
+        try:
+            while frame_id != server.frame_id:
+                message = json.loads(stream.readline())
+                if message['base'] != frame_id:
+                    failures.append(f"slow viewer got a delta against frame {message['base']}, had {frame_id}")
+                    break
+                snapshot = message['delta'] if frame_id is None else main.apply_delta(snapshot, message['delta'])
+                frame_id = message['id']
+                received += 1
+        except (OSError, ValueError) as e:
+            failures.append(f"slow viewer stuck at frame {frame_id} of {server.frame_id}: {e}")
+        if frame_id == server.frame_id:
+            if wire(snapshot) != newest:
+                failures.append("slow viewer's newest frame differs from the published snapshot")
+            if received >= len(snapshots):
+                failures.append(f"slow viewer got all {received} frames instead of skipping")
+    finally:
+        server.stop()
+        for client in sockets:
+            client.close()
+    return failures
+
+def random_hazards(rng, count):
+    """Drones and lasers scattered over the screen and the stretch above it"""
+    hazards = []
+    for _ in range(count):
+        if rng.random() < 0.6:
+            hazards.append(main.Obstacle(rng.randint(-60, main.WIDTH - 80), rng.uniform(-700, 500), 'drone'))
+        else:
+            x1, y1 = rng.randint(50, main.WIDTH - 50), rng.uniform(-700, 500)
+            hazards.append(main.Laser(x1, y1, rng.randint(50, main.WIDTH - 50), y1 - rng.randint(0, 300)))
+    return hazards
+
+def drone_wall(y, gap_left, gap_right):
+    """Drones shoulder to shoulder across the screen at y, opaque boxes touching, except between gap_left and gap_right"""
+    box = main.Obstacle(0, 0, 'drone').bounds
+    drones = []
+    right = gap_left
+    while right > 0:
+        drones.append(main.Obstacle(right - box.right, y, 'drone'))
+        right -= box.width
+    left = gap_right
+    while left < main.WIDTH:
+        drones.append(main.Obstacle(left - box.left, y, 'drone'))
+        left += box.width
+    return drones
+
+def random_layout(rng):
+    """Scattered hazards, or two staggered drone walls whose gaps and the corridor
+    between them are close to the player's own size, plus a few strays"""
+    if rng.random() < 0.5:
+        return random_hazards(rng, rng.randint(6, 24))
+    drone_height = main.Obstacle(0, 0, 'drone').bounds.height
+    y = rng.uniform(-200, 300)
+    hazards = []
+    for _ in range(2):
+        gap_left = rng.uniform(0, main.WIDTH - 150)
+        hazards += drone_wall(y, gap_left, gap_left + rng.uniform(40, 150))
+        y -= drone_height + rng.uniform(20, 160)
+    return hazards + random_hazards(rng, rng.randint(0, 3))
+
+def lattice_path_exists(hazards, player, step=4):
+    """Reference for OccupancyGrid.path_exists: the same movement model walked on
+    a step-pixel lattice of player positions, each tested against every span"""
+    box = player.bounds
+    spans = [span for hazard in hazards for span in hazard.occupied_spans(main.GRID_CELL)]
+    # Once the player's top-left corner is this high, everything is below it
+    goal = min((top for top, bottom, left, right in spans), default=0) - box.bottom
+    xs = range(0, main.WIDTH - player.width + 1, step)
+    y = main.HEIGHT - player.height
+    reach = None
+    while True:
+        row = [(left, right) for top, bottom, left, right in spans if top < y + box.bottom and y + box.top < bottom]
+        free = [not any(left < x + box.right and x + box.left < right for left, right in row) for x in xs]
+        if reach is None:
+            reach = free
+        else:
+            # Up one step, at most one step sideways, then anywhere along the free run by waiting
+            reach = [free[i] and any(reach[max(0, i - 1):i + 2]) for i in range(len(xs))]
+            for i in range(1, len(xs)):
+                reach[i] = reach[i] or (free[i] and reach[i - 1])
+            for i in range(len(xs) - 2, -1, -1):
+                reach[i] = reach[i] or (free[i] and reach[i + 1])
+        if not any(reach) or y <= goal:
+            return any(reach)
+        y -= step
+
+def check_grid(rng, layouts=200):
+    """OccupancyGrid.path_exists, after incremental adds and removes, against a
+    brute-force lattice walk, and against a grid built from scratch. A cell is
+    blocked if any position in it is, so the grid may refuse a squeeze the lattice
+    fits through, but never the reverse."""
+    player = main.Player()
+    failures = []
+    passable = refused = 0
+    for layout in range(layouts):
+        grid = main.OccupancyGrid(player.width, player.height, player.bounds)
+        hazards = random_layout(rng)
+        rng.shuffle(hazards)
+        # Checks between the adds and removes leave the reach cache warm, as spawning does
+        for hazard in hazards:
+            grid.path_exists(grid.cells(hazard))
+            grid.add(hazard)
+        for hazard in rng.sample(hazards, len(hazards) // 4):
+            grid.path_exists()
+            grid.remove(hazard)
+            hazards.remove(hazard)
+        candidate = random_hazards(rng, 1)[0]
+        expected = lattice_path_exists(hazards + [candidate], player)
+        got = grid.path_exists(grid.cells(candidate))
+        fresh = main.OccupancyGrid(player.width, player.height, player.bounds)
+        for hazard in hazards:
+            fresh.add(hazard)
+        if got != fresh.path_exists(fresh.cells(candidate)):
+            failures.append(f"layout {layout}: the incrementally updated grid disagrees with a fresh one")
+        if got and not expected:
+            failures.append(f"layout {layout}: the grid finds a way through that the lattice does not")
+        passable += expected
+        refused += expected and not got
+    if not 0 < passable < layouts:
+        failures.append(f"{passable} of {layouts} layouts passable; the check needs both kinds")
+    elif refused * 5 > passable * 3:
+        # Around two in five here; inflating by the whole player sprite again pushes it to about 70%
+        failures.append(f"the grid refused {refused} of {passable} passable layouts")
+    return failures
+
+def dense_contact(rect_a, mask_a, rect_b, mask_b, motion, per_px=4, slack=0):
+    """Pixels of motion during which the masks overlap, sampling the path per_px
+    times a pixel. With slack, offsets up to that far off the path count too."""
+    vx, vy = motion
+    samples = per_px * max(abs(vx), abs(vy), 1)
+    nudges = [(dx, dy) for dx in range(-slack, slack + 1) for dy in range(-slack, slack + 1)]
+    hits = 0
+    for i in range(samples + 1):
+        x = round(rect_b.x - rect_a.x - (1 - i / samples) * vx)
+        y = round(rect_b.y - rect_a.y - (1 - i / samples) * vy)
+        hits += any(mask_a.overlap(mask_b, (x + dx, y + dy)) is not None for dx, dy in nudges)
+    return hits / per_px
+
+# Contacts shorter than this, in pixels of motion, are grazes a sweep may miss
+GRAZE_PX = 4
+
+def sweep_disagrees(swept, rect_a, mask_a, rect_b, mask_b, motion):
+    """Whether a swept result is wrong by more than its sampling allows: it may miss
+    a graze, or land on a pixel beside the path"""
+    if swept:
+        return dense_contact(rect_a, mask_a, rect_b, mask_b, motion, slack=1) == 0
+    return dense_contact(rect_a, mask_a, rect_b, mask_b, motion) >= GRAZE_PX
+
+def sweep_shapes(rng):
+    """(name, rect, mask) for every kind of entity the game sweeps, in a random frame"""
+    drone = main.Obstacle(0, 0, 'drone')
+    drone.animation.index = rng.randrange(len(drone.animation.frames))
+    player = main.Player()
+    player.animation.index = rng.randrange(len(player.animation.frames))
+    laser = main.Laser(300, 300, 300 + rng.randint(-200, 200), 300 - rng.randint(60, 300))
+    bullet = main.Bullet(300, 300)
+    coin = main.Coin(300, 300)
+    return [('drone', drone.rect, drone.get_mask()), ('player', player.rect, player.get_mask()),
+            ('laser', laser.get_mask_rect(), laser.get_mask()), ('bullet', bullet.rect, bullet.get_mask()),
+            ('coin', coin.rect, coin.get_mask())]
+
+def check_sweep(rng, pairs=3000, shots=300):
+    """swept_masks_overlap against dense sampling of the same path, for every pair
+    of entity shapes; then bullets fired at drones in GameState with big steps,
+    against the path each one actually took"""
+    failures = []
+    for pair in range(pairs):
+        shapes = sweep_shapes(rng)
+        name_a, rect_a, mask_a = rng.choice(shapes)
+        name_b, rect_b, mask_b = rng.choice(shapes)
+        rect_a, rect_b = rect_a.move(400 - rect_a.x, 300 - rect_a.y), rect_b.copy()
+        rect_b.center = (rect_a.centerx + rng.randint(-rect_a.width, rect_a.width),
+                         rect_a.centery + rng.randint(-rect_a.height, rect_a.height))
+        motion = (rng.randint(-60, 60), rng.randint(-60, 60))
+        swept = main.swept_masks_overlap(rect_a, mask_a, rect_b, mask_b, motion)
+        if sweep_disagrees(swept, rect_a, mask_a, rect_b, mask_b, motion):
+            failures.append(f"{name_b} moving {motion} past {name_a}: sweep says {swept}")
+
+    for shot in range(shots):
+        state = main.GameState(rng.randrange(2**32))
+        state.player.invincible = True
+        state.obstacles, state.lasers, state.grid = [], [], None
+        state.spawn_timer = state.laser_timer = state.coin_line_timer = -10**6
+        drone = main.Obstacle(rng.randint(200, 600), rng.uniform(-100, 300), 'drone')
+        bullet = main.Bullet(drone.rect.centerx + rng.randint(-70, 70), drone.rect.bottom + rng.randint(0, 150))
+        state.obstacles.append(drone)
+        state.bullets.append(bullet)
+        dt = rng.choice([1, 3, 6, 10])
+        # Copies stepped on their own give where each really went
+        drone_path = main.Obstacle(drone.rect.x, drone.y, 'drone')
+        drone_path.animation.set_state(drone.animation.get_state())
+        bullet_path = main.Bullet(bullet.x, bullet.y)
+        drone_start, bullet_start = drone_path.rect.y, bullet_path.rect.y
+        state.update(main.VirtualKeys(), dt)
+        drone_path.update(state.scroll_speed, dt)
+        bullet_path.update(dt)
+        hit = drone not in state.obstacles
+        motion = (0, (bullet_path.rect.y - bullet_start) - (drone_path.rect.y - drone_start))
+        if sweep_disagrees(hit, drone_path.rect, drone_path.get_mask(), bullet_path.rect, bullet_path.get_mask(), motion):
+            failures.append(f"bullet at {bullet.x},{bullet.y} vs drone at {drone.rect.x},{drone.y}, "
+                            f"step {dt}: {'hit' if hit else 'missed'}")
+    return failures
+
+
+CHECKS = {
+    'delta': check_delta,
+    'spectator': check_spectator,
+    'grid': check_grid,
+    'sweep': check_sweep,
+}
+
+
+def run_checks(options):
+    failed = 0
+    for name in options.only or CHECKS:
+        start = time.perf_counter()
+        failures = CHECKS[name](random.Random(options.seed))
+        elapsed = time.perf_counter() - start
+        if failures:
+            failed += 1
+            print(f"FAIL {name} ({elapsed:.1f}s): {len(failures)} problem(s)")
+            for failure in failures[:options.top]:
+                print(f"  {failure}")
+        else:
+            print(f"ok   {name} ({elapsed:.1f}s)")
+    return 1 if failed else 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run RoboRun's self-checks")
+    parser.add_argument('--only', nargs='+', choices=sorted(CHECKS), help="checks to run (default: all)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--top', type=int, default=5, help="problems to print per failing check")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run_checks(parse_args()))
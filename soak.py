@@ -0,0 +1,310 @@
+"""Long-run soak test for the desktop build.
+
+Drives GameState for a simulated duration with scripted inputs, headless or
+drawing through the dummy SDL driver, and samples tracemalloc, entity list
+sizes and per-frame timing along the way. Exits with status 1 when memory
+growth or frame-time drift goes over the thresholds.
+
+    python soak.py --minutes 60 --script weave
+    python soak.py --minutes 10 --no-render --max-growth-mb 2
+    python soak.py --minutes 5 --ghosts 300
+"""
+import os
+
+# Soak runs never need a real window or audio device
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import ast
+import gc
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pygame
+
+import main
+
+
+# Each script is built fresh for a run, so nothing it remembers carries over to the next one.
+# Scripts are called every step_ticks ticks; tick % N < step_ticks fires once per N ticks at any step.
+
+def idle_script(rng, step_ticks):
+    def script(tick, state):
+        return main.VirtualKeys()
+    return script
+
+def weave_script(rng, step_ticks):
+    """Sweep left and right across the screen, bobbing up and down and shooting"""
+    def script(tick, state):
+        phase = (tick // 90) % 2
+        keys = main.VirtualKeys({
+            pygame.K_LEFT: phase == 0,
+            pygame.K_RIGHT: phase == 1,
+            pygame.K_UP: (tick // 240) % 4 == 1,
+            pygame.K_DOWN: (tick // 240) % 4 == 3,
+        })
+        if tick % 30 < step_ticks:
+            state.shoot()
+        return keys
+    return script
+
+def random_script(rng, step_ticks):
+    """Random inputs held for short stretches, like an unfocused player"""
+    keys = main.VirtualKeys()
+
+    def script(tick, state):
+        nonlocal keys
+        if tick % 15 < step_ticks:
+            keys = main.VirtualKeys({
+                key: rng.random() < 0.3
+                for key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN)
+            })
+            if rng.random() < 0.2:
+                state.shoot()
+        return keys
+    return script
+
+def autopilot_script(rng, step_ticks):
+    """Let the built-in autopilot play. Its planning time is not counted in frame times."""
+    autopilot = main.Autopilot(seed=rng.random())
+
+    def script(tick, state):
+        keys, shoot = autopilot.plan(state)
+        if shoot:
+            state.shoot()
+        return keys
+    return script
+
+SCRIPTS = {
+    'idle': idle_script,
+    'weave': weave_script,
+    'random': random_script,
+    'autopilot': autopilot_script,
+}
+
+
+def ghost_traces(count, ticks, width, height, rng, walk_ticks=300):
+    """Traces for --ghosts without a run history. Each ghost wanders off on a
+    random walk and retraces it back to the start, over and over."""
+    traces = []
+    for _ in range(count):
+        recorder = main.GhostRecorder()
+        x = rng.randrange(main.WIDTH - width)
+        y = rng.randrange(main.HEIGHT - height)
+        recorder.record(x, y)
+        path = [(x, y)]
+        for _ in range(walk_ticks):
+            x = min(max(x + rng.randint(-6, 6), 0), main.WIDTH - width)
+            y = min(max(y + rng.randint(-6, 6), 0), main.HEIGHT - height)
+            path.append((x, y))
+        for x, y in path[1:] + path[-2::-1]:
+            recorder.record(x, y)
+        # Everything after the opening absolute position adds up to no movement, so it repeats cleanly
+        data = recorder.tobytes()
+        loop = data[5:]
+        traces.append(data[:5] + loop * (ticks // (len(loop) // 2) + 1))
+    return traces
+
+def source_scopes(path):
+    """(start, end, qualified name) for every class and function in a source file"""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    scopes = []
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+                name = prefix + child.name
+                scopes.append((child.lineno, child.end_lineno, name))
+                visit(child, name + '.')
+    visit(tree, '')
+    return scopes
+
+def scope_at(scopes, lineno):
+    """Innermost class or function containing a line, e.g. 'Laser.draw'"""
+    best = None
+    for start, end, name in scopes:
+        if start <= lineno <= end and (best is None or start >= best[0]):
+            best = (start, name)
+    return best[1] if best else '<module>'
+
+def count_instances():
+    """Live instances of every class defined in main.py"""
+    classes = tuple(obj for obj in vars(main).values()
+                    if isinstance(obj, type) and obj.__module__ == main.__name__)
+    counts = dict.fromkeys((cls.__name__ for cls in classes), 0)
+    for obj in gc.get_objects():
+        if isinstance(obj, classes):
+            counts[type(obj).__name__] += 1
+    return counts
+
+def entity_counts(state):
+    return {
+        'obstacles': len(state.obstacles),
+        'lasers': len(state.lasers),
+        'coins': len(state.coins),
+        'powerups': len(state.powerups),
+        'bullets': len(state.bullets),
+        'explosions': len(state.explosions),
+    }
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ))
+
+
+def run_soak(options):
+    rng = random.Random(options.seed)
+    script = SCRIPTS[options.script](rng, options.step_ticks)
+    total_ticks = int(options.minutes * 60 * main.FPS)
+    sample_ticks = max(1, int(options.sample_seconds * main.FPS))
+    warmup_ticks = int(options.warmup_seconds * main.FPS)
+    main_scopes = source_scopes(main.__file__)
+
+    state = main.GameState(options.seed)
+    race = None
+    if options.ghosts:
+        race = main.GhostRace(ghost_traces(options.ghosts, total_ticks, state.player.width,
+                                           state.player.height, random.Random(options.seed)))
+
+    tracemalloc.start(options.frames)
+    deaths = 0
+    frame_times = []
+    samples = []
+    baseline_snapshot = None
+    baseline_memory = None
+    baseline_instances = None
+    next_sample = None
+
+    for tick in range(0, total_ticks, options.step_ticks):
+        keys = script(tick, state)
+        start = time.perf_counter()
+        death_cause = state.update(keys, options.step_ticks)
+        if race is not None:
+            for _ in range(options.step_ticks):
+                race.step()
+        if options.render:
+            main.virtual_surface.fill(main.BLACK)
+            state.draw(main.virtual_surface, race)
+            main.present_frame()
+        frame_times.append((time.perf_counter() - start) * 1000)
+
+        if death_cause:
+            deaths += 1
+            if options.mortal:
+                state = main.GameState(options.seed + deaths)
+            else:
+                state.death_cause = None
+
+        if baseline_snapshot is None and tick >= warmup_ticks:
+            next_sample = tick + sample_ticks
+            gc.collect()
+            baseline_snapshot = take_snapshot()
+            baseline_memory = tracemalloc.get_traced_memory()[0]
+            baseline_instances = count_instances()
+            frame_times.clear()
+        elif next_sample is not None and tick >= next_sample:
+            next_sample += sample_ticks
+            samples.append({
+                'seconds': tick / main.FPS,
+                'memory': tracemalloc.get_traced_memory()[0] - baseline_memory,
+                'frame_ms': statistics.median(frame_times),
+                'frame_p95_ms': sorted(frame_times)[int(len(frame_times) * 0.95)],
+                'entities': entity_counts(state),
+            })
+            frame_times.clear()
+            if options.verbose:
+                print_sample(samples[-1])
+
+    gc.collect()
+    final_snapshot = take_snapshot()
+    final_memory = tracemalloc.get_traced_memory()[0]
+    final_instances = count_instances()
+    tracemalloc.stop()
+
+    if len(samples) < 2:
+        print("Run too short for a soak report: increase --minutes or lower --sample-seconds")
+        return 1
+
+    outcome = "deaths" if options.mortal else "collision ticks ignored"
+    print(f"Soak: {options.minutes:g} simulated minutes, script={options.script}, "
+          f"render={options.render}, step={options.step_ticks} ticks, ghosts={options.ghosts}, {outcome}={deaths}")
+    print(f"{'time':>8} {'memory':>10} {'frame':>8} {'p95':>8}  entities")
+    for sample in samples:
+        print_sample(sample)
+
+    growth_mb = (final_memory - baseline_memory) / (1024 * 1024)
+    first_ms = samples[0]['frame_ms']
+    last_ms = samples[-1]['frame_ms']
+    drift = last_ms / first_ms if first_ms > 0 else 1.0
+
+    print("\nTop allocation sites since warmup:")
+    stats = [stat for stat in final_snapshot.compare_to(baseline_snapshot, 'lineno') if stat.size_diff > 0]
+    for stat in stats[:options.top]:
+        frame = stat.traceback[0]
+        where = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+        if os.path.abspath(frame.filename) == os.path.abspath(main.__file__):
+            where += f" ({scope_at(main_scopes, frame.lineno)})"
+        print(f"  {stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+7d} blocks  {where}")
+
+    grown = {name: final_instances[name] - baseline_instances.get(name, 0)
+             for name in final_instances if final_instances[name] != baseline_instances.get(name, 0)}
+    if grown:
+        print("\nLive instance changes since warmup:")
+        for name, diff in sorted(grown.items(), key=lambda item: -item[1]):
+            print(f"  {name:<16} {diff:+d} (now {final_instances[name]})")
+
+    failures = []
+    if growth_mb > options.max_growth_mb:
+        failures.append(f"memory grew {growth_mb:.2f} MiB (limit {options.max_growth_mb} MiB)")
+    if drift > options.max_drift:
+        failures.append(f"frame time drifted {first_ms:.3f} -> {last_ms:.3f} ms, x{drift:.2f} (limit x{options.max_drift})")
+
+    print(f"\nMemory growth: {growth_mb:.2f} MiB, frame-time drift: x{drift:.2f}")
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        return 1
+    print("PASS")
+    return 0
+
+def print_sample(sample):
+    entities = ' '.join(f"{name}={count}" for name, count in sample['entities'].items())
+    print(f"{sample['seconds']:7.0f}s {sample['memory'] / 1024:+9.1f}K "
+          f"{sample['frame_ms']:7.3f}ms {sample['frame_p95_ms']:7.3f}ms  {entities}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Soak-test RoboRun for memory and frame-time drift")
+    parser.add_argument('--minutes', type=float, default=10, help="simulated minutes to run")
+    parser.add_argument('--script', choices=sorted(SCRIPTS), default='weave', help="input script")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-render', dest='render', action='store_false',
+                        help="skip drawing and only run the simulation")
+    parser.add_argument('--mortal', action='store_true',
+                        help="start a new run on death instead of ignoring collisions")
+    parser.add_argument('--step-ticks', type=int, default=1,
+                        help="ticks simulated per update, for fast-forwarding long headless runs")
+    parser.add_argument('--ghosts', type=int, default=0, metavar='N',
+                        help="race N synthetic ghosts, to stress the sprite batching")
+    parser.add_argument('--sample-seconds', type=float, default=60, help="simulated seconds between samples")
+    parser.add_argument('--warmup-seconds', type=float, default=30,
+                        help="simulated seconds before the memory baseline is taken")
+    parser.add_argument('--max-growth-mb', type=float, default=4.0)
+    parser.add_argument('--max-drift', type=float, default=1.5,
+                        help="allowed ratio of last to first median frame time")
+    parser.add_argument('--frames', type=int, default=1, help="traceback depth kept by tracemalloc")
+    parser.add_argument('--top', type=int, default=10, help="allocation sites to report")
+    parser.add_argument('--verbose', action='store_true', help="print samples as they are taken")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run_soak(parse_args()))
@@ -0,0 +1,111 @@
+"""Minimal spectator for RoboRun runs streamed with `python main.py --spectate PORT`.
+
+Receives the per-tick state deltas published by main.SpectatorServer and
+draws them with the game's own drawing code.
+
+    python spectator.py --port 8765
+"""
+import argparse
+import json
+import socket
+import sys
+import threading
+
+import pygame
+
+import main
+
+
+class SpectatorClient:
+    """Reads the spectator stream on a background thread and keeps the newest snapshot"""
+    def __init__(self, host='127.0.0.1', port=8765):
+        self.sock = socket.create_connection((host, port))
+        self.stream = self.sock.makefile('rb')
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.frame_id = None
+        self.frames_received = 0
+        self.connected = True
+        self.thread = None
+
+    def receive(self):
+        """Read and apply one message. Returns the new snapshot, or None once disconnected."""
+        line = self.stream.readline()
+        if not line:
+            self.connected = False
+            return None
+        message = json.loads(line)
+        if message['base'] is None:
+            snapshot = message['delta']
+        elif message['base'] == self.frame_id:
+            snapshot = main.apply_delta(self.snapshot, message['delta'])
+        else:
+            raise ValueError(f"delta against frame {message['base']}, have {self.frame_id}")
+        with self.lock:
+            self.snapshot = snapshot
+            self.frame_id = message['id']
+            self.frames_received += 1
+        return snapshot
+
+    def start(self):
+        self.thread = threading.Thread(target=self._receive_loop, name="spectator-client", daemon=True)
+        self.thread.start()
+
+    def _receive_loop(self):
+        try:
+            while self.receive() is not None:
+                pass
+        except (OSError, ValueError) as e:
+            print(f"Spectator stream ended: {e}")
+            self.connected = False
+
+    def latest(self):
+        with self.lock:
+            return self.snapshot
+
+    def close(self):
+        self.connected = False
+        self.sock.close()
+
+
+def run(host, port):
+    try:
+        client = SpectatorClient(host, port)
+    except OSError as e:
+        print(f"Error connecting to {host}:{port}: {e}")
+        return 1
+    client.start()
+    pygame.display.set_caption("RoboRun - Spectator")
+
+    state = None
+    while True:
+        main.clock.tick(main.FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                client.close()
+                pygame.quit()
+                return 0
+            if event.type == pygame.VIDEORESIZE:
+                main.request_resize(event.w, event.h)
+
+        main.virtual_surface.fill(main.BLACK)
+        snapshot = client.latest()
+        if snapshot is not None:
+            if state is None:
+                state = main.GameState.from_snapshot(snapshot)
+            else:
+                state.restore(snapshot)
+            state.draw(main.virtual_surface)
+        if not client.connected:
+            main.display_text("Stream ended", 36, main.WIDTH // 2 - 100, main.HEIGHT // 2, main.RED)
+        elif snapshot is None:
+            main.display_text("Waiting for game...", 36, main.WIDTH // 2 - 140, main.HEIGHT // 2)
+        main.present_frame()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a RoboRun game streamed with --spectate")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    sys.exit(run(args.host, args.port))